@@ -0,0 +1,7 @@
+# Synthetic-data benchmarks for the dashboard's data paths.
+#
+#   python -m benchmark generate --dsn postgresql://localhost/foodreach_bench --scale national
+#   python -m benchmark run --dsn postgresql://localhost/foodreach_bench --repeat 20
+#
+# Point --dsn at a scratch database: generate drops and recreates the
+# dashboard tables there.
@@ -0,0 +1,72 @@
+import argparse
+import json
+import sys
+
+import psycopg2
+
+import db
+import embedded
+from benchmark import generate, harness
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="load synthetic data into a scratch database")
+    gen.add_argument("--dsn", required=True)
+    gen.add_argument("--scale", choices=sorted(generate.SCALES), default="national")
+    gen.add_argument("--states", type=int)
+    gen.add_argument("--counties-per-state", type=int)
+    gen.add_argument("--tracts-per-county", type=int)
+    gen.add_argument("--seed", type=int, default=42)
+    gen.add_argument("--replace", action="store_true", help="overwrite existing dashboard tables")
+
+    bench = commands.add_parser("run", help="time the dashboard's data paths")
+    target = bench.add_mutually_exclusive_group(required=True)
+    target.add_argument("--dsn")
+    target.add_argument("--embedded", metavar="PATH", help="time a DuckDB file from `python embedded.py export` instead")
+    bench.add_argument("--repeat", type=int, default=20)
+    bench.add_argument("--skip-save", action="store_true", help="do not time (and commit) Demographics saves")
+    bench.add_argument("--json", help="also write the results to this file")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        conn = psycopg2.connect(args.dsn)
+        try:
+            counts = generate.generate(
+                conn,
+                scale=args.scale,
+                seed=args.seed,
+                replace=args.replace,
+                states=args.states,
+                counties_per_state=args.counties_per_state,
+                tracts_per_county=args.tracts_per_county,
+            )
+        except RuntimeError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        finally:
+            conn.close()
+        for table, count in counts.items():
+            print(f"{table:<20} {count:>10,} rows")
+        return 0
+
+    if args.embedded:
+        # Read-only, so there are no saves to time
+        embedded.init_pool(args.embedded)
+        include_save = False
+    else:
+        db.init_pool(dsn=args.dsn)
+        include_save = not args.skip_save
+    results = harness.run(repeat=args.repeat, include_save=include_save)
+    print(harness.format_results(results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+import rollups
+
+# Deterministic synthetic FoodReach data with the same tables and columns the
+# dashboard reads. Tract ids follow the census layout (2-digit state, 3-digit
+# county, 6-digit tract), so tract_id prefixes select a state or county the
+# way they do in the real data.
+
+SCALES = {
+    # One state's worth of tracts
+    "state": {"states": 1, "counties_per_state": 62, "tracts_per_county": 24},
+    # Roughly the national ~73k tracts
+    "national": {"states": 51, "counties_per_state": 62, "tracts_per_county": 23},
+    # 10x national, for stress runs
+    "stress": {"states": 51, "counties_per_state": 62, "tracts_per_county": 230},
+}
+
+# County names are built from these so the selector's prefix search has a
+# realistic spread of first letters
+NAME_PARTS = [
+    "Ada", "Bar", "Cal", "Dun", "Elm", "Fair", "Glen", "Har", "Iron", "Jef",
+    "Kin", "Lin", "Mar", "Nor", "Oak", "Pine", "Quin", "Ros", "San", "Tay",
+    "Un", "Val", "Wash", "York", "field", "ton", "ford", "ville", "more", "wood",
+]
+
+TABLES = ["Demographics", "FoodAccessIndicator", "LowAccess1Mile", "CensusTract", "County", "State"]
+
+schema_sql = """
+CREATE TABLE public."State" (
+    state_id integer PRIMARY KEY,
+    state_name text NOT NULL
+);
+
+CREATE TABLE public."County" (
+    county_id integer PRIMARY KEY,
+    county_name text NOT NULL,
+    state_id integer NOT NULL REFERENCES public."State" (state_id)
+);
+
+CREATE TABLE public."CensusTract" (
+    tract_id bigint PRIMARY KEY,
+    county_id integer NOT NULL REFERENCES public."County" (county_id)
+);
+
+CREATE TABLE public."LowAccess1Mile" (
+    tract_id bigint PRIMARY KEY REFERENCES public."CensusTract" (tract_id),
+    population1 numeric,
+    "lowIncomei1" numeric,
+    kids1 numeric,
+    seniors1 numeric,
+    white1 numeric,
+    black1 numeric,
+    asian1 numeric,
+    islander1 numeric,
+    americindian1 numeric,
+    other1 numeric,
+    hisp1 numeric,
+    "noVehicle1" numeric,
+    snap1 numeric
+);
+
+CREATE TABLE public."FoodAccessIndicator" (
+    tract_id bigint PRIMARY KEY REFERENCES public."CensusTract" (tract_id),
+    "POP2010" integer,
+    "LowAccessPopulation1and10" numeric,
+    "Urban" integer
+);
+
+CREATE TABLE public."Demographics" (
+    id serial PRIMARY KEY,
+    tract_id bigint NOT NULL REFERENCES public."CensusTract" (tract_id),
+    "TractLowIncome" integer,
+    "TractKids" integer,
+    "TractSeniors" integer,
+    "TractSNAP" integer
+);
+"""
+
+
+def build_frames(states, counties_per_state, tracts_per_county, seed=42):
+    rng = np.random.default_rng(seed)
+
+    state = pd.DataFrame({
+        "state_id": np.arange(1, states + 1),
+        "state_name": [f"State {i:02d}" for i in range(1, states + 1)],
+    })
+
+    county_state = np.repeat(state["state_id"].to_numpy(), counties_per_state)
+    county_num = np.tile(np.arange(1, counties_per_state + 1), states)
+    county = pd.DataFrame({
+        "county_id": county_state * 1000 + county_num,
+        "county_name": [
+            f"{NAME_PARTS[a]}{NAME_PARTS[b].lower()}"
+            for a, b in zip(rng.integers(0, 24, len(county_num)), rng.integers(0, len(NAME_PARTS), len(county_num)))
+        ],
+        "state_id": county_state,
+    })
+
+    tract_county = np.repeat(county["county_id"].to_numpy(), tracts_per_county)
+    tract_num = np.tile(np.arange(1, tracts_per_county + 1), len(county))
+    tract_ids = tract_county.astype(np.int64) * 1_000_000 + tract_num
+    n = len(tract_ids)
+    tract = pd.DataFrame({"tract_id": tract_ids, "county_id": tract_county})
+
+    population = rng.lognormal(mean=8.2, sigma=0.4, size=n).round()
+    urban = (rng.random(n) < 0.7).astype(int)
+    # Rural tracts are more often far from a store
+    low_access_share = np.where(urban == 1, rng.beta(1.2, 5, n), rng.beta(2, 3, n))
+    low_access_pop = (population * low_access_share).round()
+
+    def share(low, high):
+        return (low_access_pop * rng.uniform(low, high, n)).round()
+
+    low_access = pd.DataFrame({
+        "tract_id": tract_ids,
+        "population1": low_access_pop,
+        "lowIncomei1": share(0.1, 0.5),
+        "kids1": share(0.15, 0.3),
+        "seniors1": share(0.1, 0.25),
+        "white1": share(0.3, 0.9),
+        "black1": share(0.0, 0.4),
+        "asian1": share(0.0, 0.15),
+        "islander1": share(0.0, 0.01),
+        "americindian1": share(0.0, 0.05),
+        "other1": share(0.0, 0.1),
+        "hisp1": share(0.0, 0.4),
+        "noVehicle1": (low_access_pop / 2.6 * rng.uniform(0.0, 0.15, n)).round(),
+        "snap1": (low_access_pop / 2.6 * rng.uniform(0.0, 0.3, n)).round(),
+    })
+
+    food_access = pd.DataFrame({
+        "tract_id": tract_ids,
+        "POP2010": population.astype(np.int64),
+        "LowAccessPopulation1and10": low_access_pop,
+        "Urban": urban,
+    })
+
+    demographics = pd.DataFrame({
+        "tract_id": tract_ids,
+        "TractLowIncome": (population * rng.uniform(0.1, 0.5, n)).round().astype(np.int64),
+        "TractKids": (population * rng.uniform(0.15, 0.3, n)).round().astype(np.int64),
+        "TractSeniors": (population * rng.uniform(0.1, 0.25, n)).round().astype(np.int64),
+        "TractSNAP": (population / 2.6 * rng.uniform(0.0, 0.3, n)).round().astype(np.int64),
+    })
+
+    return {
+        "State": state,
+        "County": county,
+        "CensusTract": tract,
+        "LowAccess1Mile": low_access,
+        "FoodAccessIndicator": food_access,
+        "Demographics": demographics,
+    }
+
+
+def existing_tables(conn):
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT table_name FROM information_schema.tables "
+        "WHERE table_schema = 'public' AND table_name = ANY(%s);",
+        (TABLES,),
+    )
+    found = [row[0] for row in cur.fetchall()]
+    cur.close()
+    return found
+
+
+def copy_frame(cur, table, frame):
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    columns = ", ".join(f'"{col}"' for col in frame.columns)
+    cur.copy_expert(f'COPY public."{table}" ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def generate(conn, scale="national", seed=42, replace=False, **sizes):
+    # Drops and recreates the dashboard tables, so it refuses to touch a
+    # database that already has them unless replace=True
+    params = dict(SCALES[scale])
+    params.update({k: v for k, v in sizes.items() if v is not None})
+
+    found = existing_tables(conn)
+    if found and not replace:
+        raise RuntimeError(
+            f"Tables already exist ({', '.join(found)}); pass --replace (replace=True) to overwrite them"
+        )
+
+    frames = build_frames(seed=seed, **params)
+    cur = conn.cursor()
+    for table in TABLES:
+        cur.execute(f'DROP TABLE IF EXISTS public."{table}" CASCADE;')
+    cur.execute(schema_sql)
+    for table in reversed(TABLES):
+        copy_frame(cur, table, frames[table])
+    cur.close()
+    conn.commit()
+
+    # The dashboard reads the rollups, not the tract tables (the old views
+    # went with the DROP ... CASCADE above); new data means a new version stamp
+    rollups.setup(conn)
+    rollups.bump_version(conn)
+
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("ANALYZE;")
+    cur.close()
+    conn.autocommit = False
+
+    return {table: len(frame) for table, frame in frames.items()}
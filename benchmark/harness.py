@@ -0,0 +1,252 @@
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+import compare
+import county_search
+import db
+import demographics
+import queries
+import rankings
+import resultcache
+import snapshot
+
+# Times the dashboard's data paths against whatever database the pool points
+# at. Every case reports its first ("cold") call separately from the
+# percentiles of the following ("warm") calls, plus the peak Python memory of
+# one extra traced call.
+
+
+def measure(fn, repeat):
+    start = time.perf_counter()
+    fn()
+    cold = time.perf_counter() - start
+
+    warm = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        warm.append(time.perf_counter() - start)
+
+    # tracemalloc slows everything down, so memory gets its own pass
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    warm_ms = np.array(warm) * 1000
+    return {
+        "cold_ms": round(cold * 1000, 3),
+        "p50_ms": round(float(np.percentile(warm_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(warm_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(warm_ms, 99)), 3),
+        "max_ms": round(float(warm_ms.max()), 3),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def loader_cases():
+    # Straight from Postgres, what every cache miss pays
+    return {
+        f"query:{name}": (lambda fn=fn: db.run(fn))
+        for name, fn in [
+            ("states", queries.query_states),
+            ("lowAccess", queries.query_lowAccess),
+            ("state_rollup", queries.query_state_rollup),
+            ("county_and_state", queries.query_county_and_state),
+        ]
+    }
+
+
+def snapshot_cases(snapshot_root):
+    # What a freshly started process pays once the snapshots exist
+    os.environ["SNAPSHOT_DIR"] = snapshot_root
+    cases = {}
+    for name, fn in [
+        ("county_rollup", queries.query_lowAccess),
+        ("state_rollup", queries.query_state_rollup),
+        ("county_and_state", queries.query_county_and_state),
+    ]:
+        snapshot.write_snapshot(name, 0, db.run(fn))
+        cases[f"snapshot:{name}"] = (lambda name=name: snapshot.read_snapshot(name, 0))
+    return cases
+
+
+def state_cases():
+    state_rollup = db.run(queries.query_state_rollup)
+    state_names = list(state_rollup.index)
+
+    def switch_every_state():
+        for state_name in state_names:
+            queries.rural_vs_urban_records(queries.state_row(state_rollup, state_name))
+
+    return {f"per_state:all_{len(state_names)}_states": switch_every_state}
+
+
+def county_selector_cases():
+    county_and_state = db.run(queries.query_county_and_state)
+    index = county_search.CountyIndex(county_and_state)
+    prefixes = sorted({name[:2] for name in county_and_state["county_name"].astype(str)})[:50]
+
+    def label_every_county():
+        for county_id in index.ids:
+            index.label(county_id)
+
+    def search_prefixes():
+        for prefix in prefixes:
+            index.search(prefix)
+
+    return {
+        "county_selector:build": lambda: county_search.CountyIndex(county_and_state),
+        f"county_selector:label_{len(index)}": label_every_county,
+        f"county_selector:search_{len(prefixes)}_prefixes": search_prefixes,
+    }
+
+
+def compare_cases(sizes=(10, 500)):
+    lowAccess_table = db.run(queries.query_lowAccess)
+    county_metrics = compare.county_metrics(lowAccess_table)
+    rng = np.random.default_rng(3)
+    cases = {"compare:build_county_metrics": lambda: compare.county_metrics(lowAccess_table)}
+    for size in sizes:
+        picked = rng.choice(county_metrics.index.to_numpy(), min(size, len(county_metrics)), replace=False).tolist()
+        cases[f"compare:{len(picked)}_counties"] = (
+            lambda picked=picked: compare.chart_records(compare.compare(county_metrics, picked), picked)
+        )
+    return cases
+
+
+def ranking_cases():
+    county_metrics = compare.county_metrics(db.run(queries.query_lowAccess))
+    ranks = rankings.RankIndex(county_metrics)
+    county_ids = county_metrics.index[:100].tolist()
+
+    def top_and_bottom_every_metric():
+        for metric in rankings.RANK_METRICS:
+            ranks.top(metric)
+            ranks.bottom(metric)
+
+    def standing_of_100_counties():
+        for county_id in county_ids:
+            ranks.standing(county_id)
+
+    return {
+        f"rankings:build_{len(ranks)}_counties": lambda: rankings.RankIndex(county_metrics),
+        "rankings:top_bottom_every_metric": top_and_bottom_every_metric,
+        "rankings:standing_100_counties": standing_of_100_counties,
+    }
+
+
+def result_cache_cases():
+    # Sizing is paid once per miss, the lookup on every hit
+    lowAccess_table = db.run(queries.query_lowAccess)
+    cache = resultcache.ResultCache()
+    cache.namespace("lowAccess")
+    cache.put("lowAccess", 0, lowAccess_table, 0)
+
+    def herd(sessions=16):
+        # Every session misses on the same key at once; one query runs
+        herd_cache = resultcache.ResultCache()
+        herd_cache.namespace("lowAccess")
+        threads = [
+            threading.Thread(target=herd_cache.get_or_load,
+                             args=("lowAccess", 0, lambda: db.run(queries.query_lowAccess)))
+            for _ in range(sessions)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    return {
+        "result_cache:size_county_rollup": lambda: resultcache.size_of(lowAccess_table),
+        "result_cache:hit": lambda: cache.get("lowAccess", 0),
+        "result_cache:16_concurrent_misses": herd,
+    }
+
+
+def demographics_cases():
+    # A cursor deep into the table, as if the user had paged a long way
+    def find_deep_cursor(conn):
+        cur = conn.cursor()
+        cur.execute('SELECT "id" FROM "Demographics" ORDER BY "id" OFFSET (SELECT COUNT(*) * 9 / 10 FROM "Demographics") LIMIT 1;')
+        row = cur.fetchone()
+        cur.close()
+        return (row[0], row[0]) if row else None
+
+    deep_cursor = db.run(find_deep_cursor)
+    # A save patching every row of a cached page
+    page, _ = db.run(demographics.fetch_page)
+    saved = demographics.saved_rows(page, {row_id: {"TractKids": 1} for row_id in page["id"].tolist()})
+    return {
+        "demographics:patch_page": lambda: demographics.patch_page(page, saved, "id"),
+        "demographics:first_page": lambda: db.run(demographics.fetch_page),
+        "demographics:deep_page": lambda: db.run(demographics.fetch_page, after=deep_cursor),
+        "demographics:sorted_page": lambda: db.run(demographics.fetch_page, sort="TractSNAP", descending=True),
+    }
+
+
+def save_cases(edit_counts=(10, 100, 1000), seed=7):
+    rng = np.random.default_rng(seed)
+
+    def load_ids(conn):
+        cur = conn.cursor()
+        cur.execute('SELECT "id" FROM "Demographics" ORDER BY "id" LIMIT %s;', (max(edit_counts),))
+        ids = [row[0] for row in cur.fetchall()]
+        cur.close()
+        return ids
+
+    ids = db.run(load_ids)
+    cases = {}
+    for count in edit_counts:
+        chosen = ids[:count]
+        edits = {
+            row_id: {"TractKids": int(value)}
+            for row_id, value in zip(chosen, rng.integers(0, 5000, len(chosen)))
+        }
+        cases[f"save:{len(chosen)}_rows"] = (lambda edits=edits: db.run(demographics.save_edits, edits))
+    return cases
+
+
+def run(repeat=20, include_save=True):
+    cases = {}
+    cases.update(loader_cases())
+    with tempfile.TemporaryDirectory() as snapshot_root:
+        previous_dir = os.environ.get("SNAPSHOT_DIR")
+        try:
+            cases.update(snapshot_cases(snapshot_root))
+            cases.update(state_cases())
+            cases.update(county_selector_cases())
+            cases.update(compare_cases())
+            cases.update(ranking_cases())
+            cases.update(result_cache_cases())
+            cases.update(demographics_cases())
+            if include_save:
+                cases.update(save_cases())
+
+            results = {}
+            for name, fn in cases.items():
+                results[name] = measure(fn, repeat)
+        finally:
+            if previous_dir is None:
+                os.environ.pop("SNAPSHOT_DIR", None)
+            else:
+                os.environ["SNAPSHOT_DIR"] = previous_dir
+    return results
+
+
+def format_results(results):
+    header = f"{'case':<42} {'cold ms':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10} {'peak KiB':>10}"
+    lines = [header, "-" * len(header)]
+    for name, r in results.items():
+        lines.append(
+            f"{name:<42} {r['cold_ms']:>10.2f} {r['p50_ms']:>10.2f} {r['p95_ms']:>10.2f} "
+            f"{r['p99_ms']:>10.2f} {r['max_ms']:>10.2f} {r['peak_kib']:>10.1f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+# Side-by-side comparison of any number of counties or states.
+#
+# The metric frames are built once per data version from the rollup frames,
+# indexed by county_id / state_name, with every ratio already computed as a
+# whole column. Comparing N places is then a single .loc[] take, however
+# many are picked, instead of a filter or a query per selection.
+
+# Ratio name -> (numerator, denominator) rollup columns. The low access
+# share is over everyone in the place; the others are over its low access
+# population.
+SHARES = {
+    "low_access_share": ("population1", "total_population"),
+    "no_vehicle_share": ("noVehicle1", "population1"),
+    "snap_share": ("snap1", "population1"),
+    "low_income_share": ("lowIncomei1", "population1"),
+}
+
+SHARE_LABELS = {
+    "low_access_share": "Low access",
+    "no_vehicle_share": "No vehicle",
+    "snap_share": "SNAP",
+    "low_income_share": "Low income",
+}
+
+
+def add_shares(frame):
+    # Vectorised over every row; a zero or missing denominator gives NaN
+    numerators = frame[[num for num, _ in SHARES.values()]].to_numpy(dtype=np.float64)
+    denominators = frame[[den for _, den in SHARES.values()]].to_numpy(dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = numerators / denominators
+    shares[~np.isfinite(shares)] = np.nan
+    frame = frame.copy()
+    frame[list(SHARES)] = shares
+    return frame
+
+
+def national_shares(frame):
+    # Ratio of the totals, not the mean of the ratios
+    return {
+        name: (frame[num].sum() / frame[den].sum() if frame[den].sum() else np.nan)
+        for name, (num, den) in SHARES.items()
+    }
+
+
+def build_metrics(frame):
+    # Every ratio, and every ratio against the national figure, for every row
+    frame = add_shares(frame)
+    for name, value in national_shares(frame).items():
+        frame[f"{name}_vs_national"] = frame[name] / value
+    return frame
+
+
+def county_metrics(lowAccess_table):
+    return build_metrics(lowAccess_table.set_index("county_id"))
+
+
+def state_metrics(state_rollup):
+    return build_metrics(state_rollup)
+
+
+def compare(metrics, keys):
+    # One take for the whole selection, in the order picked; keys missing
+    # from the index are dropped rather than raising
+    keys = pd.Index(keys)
+    return metrics.loc[keys[keys.isin(metrics.index)]]
+
+
+def chart_records(selection, labels):
+    # Grouped bar chart payload: one record per place, shares in percent
+    percent = (selection[list(SHARES)] * 100).round(2)
+    percent = percent.astype(object).where(percent.notna(), None)
+    records = []
+    for label, values in zip(labels, percent.itertuples(index=False)):
+        record = {"place": label}
+        record.update({SHARE_LABELS[name]: value for name, value in zip(SHARES, values)})
+        records.append(record)
+    return records
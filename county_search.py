@@ -0,0 +1,47 @@
+import bisect
+
+# Lookup structures for the "Select County" box, built once per data version
+# from the county_and_state frame instead of filtering it for every option.
+
+
+class CountyIndex:
+    """county_id -> "County (State)" labels plus a sorted prefix index."""
+
+    def __init__(self, county_and_state):
+        ids = county_and_state["county_id"].tolist()
+        labels = (county_and_state["county_name"].astype(str)
+                  + " (" + county_and_state["state_name"].astype(str) + ")").tolist()
+
+        self.ids = ids
+        self.labels = dict(zip(ids, labels))
+        # Every county of a state, with or without tract data
+        self.by_state = {}
+        for county_id, state_id in zip(ids, county_and_state["state_id"].tolist()):
+            self.by_state.setdefault(state_id, []).append(county_id)
+
+        # Sorted on the lower-cased label so every prefix match is one
+        # contiguous slice found with a binary search
+        entries = sorted(zip((label.lower() for label in labels), ids))
+        self._keys = [key for key, _ in entries]
+        self._sorted_ids = [cid for _, cid in entries]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def label(self, county_id):
+        return self.labels.get(county_id, str(county_id))
+
+    def in_state(self, state_id):
+        return self.by_state.get(state_id, [])
+
+    def search(self, prefix, limit=50):
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self._keys, prefix)
+        matches = []
+        for i in range(start, len(self._keys)):
+            if len(matches) >= limit or not self._keys[i].startswith(prefix):
+                break
+            matches.append(self._sorted_ids[i])
+        return matches
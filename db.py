@@ -0,0 +1,325 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import pyarrow as pa
+from psycopg2 import extensions, pool
+from dotenv import load_dotenv
+
+# -----------------------------
+# SETTINGS
+# -----------------------------
+DEFAULT_MIN_CONN = 1
+DEFAULT_MAX_CONN = 10
+# Connections that were used more recently than this are trusted without a ping
+DEFAULT_HEALTH_CHECK_INTERVAL = 30
+DEFAULT_CHECKOUT_TIMEOUT = 30
+
+
+def settings_from_env():
+    # Same keys as the .env file, for running helpers outside Streamlit
+    load_dotenv()
+    return {
+        "dbname": os.getenv("dbname"),
+        "user": os.getenv("user"),
+        "password": os.getenv("password"),
+        "host": os.getenv("host"),
+        "port": os.getenv("port"),
+    }
+
+
+# -----------------------------
+# RESULT DECODING
+# -----------------------------
+# Postgres type OIDs
+NUMERIC_OID = 1700
+FLOAT_OIDS = {700, 701, NUMERIC_OID}
+INT_OIDS = {20, 21, 23}
+
+# NUMERIC (every SUM() in the dashboard) decodes straight to float instead of
+# decimal.Decimal. Registered per connection so nothing else in the process
+# is affected.
+NUMERIC_AS_FLOAT = extensions.new_type(
+    (NUMERIC_OID,), "NUMERIC_AS_FLOAT",
+    lambda value, cur: float(value) if value is not None else None,
+)
+
+
+def register_decoders(conn):
+    extensions.register_type(NUMERIC_AS_FLOAT, conn)
+
+
+def frame_from_rows(rows, description):
+    # Build each column as a typed NumPy array from the cursor's type codes:
+    # floats/numerics -> float64 (NULL -> NaN), integers -> int64 (float64 if
+    # the column has NULLs), everything else stays as returned
+    names = [desc[0] for desc in description]
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    data = {}
+    for desc, name, values in zip(description, names, columns):
+        if desc.type_code in FLOAT_OIDS:
+            data[name] = np.array(values, dtype=np.float64)
+        elif desc.type_code in INT_OIDS:
+            if None in values:
+                data[name] = np.array(values, dtype=np.float64)
+            else:
+                data[name] = np.array(values, dtype=np.int64)
+        else:
+            data[name] = list(values)
+    return pd.DataFrame(data, columns=names)
+
+
+# Postgres type OID -> Arrow type, for streaming rows out as Arrow record
+# batches (exports); anything not listed becomes text
+BOOL_OID = 16
+TIMESTAMP_OIDS = {1114, 1184}
+ARROW_TYPES = {BOOL_OID: pa.bool_()}
+ARROW_TYPES.update({oid: pa.int64() for oid in INT_OIDS})
+ARROW_TYPES.update({oid: pa.float64() for oid in FLOAT_OIDS})
+ARROW_TYPES.update({oid: pa.timestamp("us", tz="UTC") for oid in TIMESTAMP_OIDS})
+
+
+def record_batch_from_rows(rows, description):
+    # Typed from the cursor's type codes like frame_from_rows(), so every
+    # batch of one query has the same schema even if a column is all NULL
+    names = [desc[0] for desc in description]
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    arrays = [
+        pa.array(values, type=ARROW_TYPES.get(desc.type_code, pa.string()))
+        for desc, values in zip(description, columns)
+    ]
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+# Optional callback(seconds) told about every query run through fetch_all(),
+# set by instrumentation.configure()
+query_observer = None
+
+
+def fetch_all(cur, query, params=None):
+    start = time.perf_counter()
+    cur.execute(query, params)
+    results = cur.fetchall()
+    if query_observer is not None:
+        query_observer(time.perf_counter() - start)
+    return results
+
+
+def stream_batches(conn, query, params=None, batch_rows=10000, name="stream"):
+    # Named (server-side) cursor: Postgres keeps the result and hands it over
+    # batch_rows at a time, so memory stays at one batch however many rows
+    # the query returns. Always yields at least one (possibly empty) batch,
+    # which carries the schema. Needs a transaction, not autocommit.
+    cur = conn.cursor(name=name)
+    cur.itersize = batch_rows
+    try:
+        start = time.perf_counter()
+        cur.execute(query, params)
+        rows = cur.fetchmany(batch_rows)
+        # A named cursor only has a description once rows have been fetched
+        description = cur.description
+        if query_observer is not None:
+            query_observer(time.perf_counter() - start)
+        yield record_batch_from_rows(rows, description)
+        while len(rows) == batch_rows:
+            rows = cur.fetchmany(batch_rows)
+            if rows:
+                yield record_batch_from_rows(rows, description)
+    finally:
+        cur.close()
+
+
+# Rows pulled from the cursor at a time when building a frame
+FETCH_CHUNK_ROWS = 5000
+INT32 = np.iinfo(np.int32)
+# Every whole number below this is exact in float32
+FLOAT32_EXACT = 2 ** 24
+
+
+def compact_frame(frame, categories=()):
+    # Narrowest dtype that holds each column: int32 where the range fits,
+    # float32 where every magnitude is below FLOAT32_EXACT, and the given
+    # (repetitive) text columns as categoricals. Columns are replaced, never
+    # modified in place.
+    for name in frame.columns:
+        col = frame[name]
+        if name in categories:
+            frame[name] = col.astype("category")
+        elif col.dtype == np.int64 and len(col) and INT32.min <= col.min() and col.max() <= INT32.max:
+            frame[name] = col.astype(np.int32)
+        elif col.dtype == np.float64 and not (col.abs() >= FLOAT32_EXACT).any():
+            frame[name] = col.astype(np.float32)
+    return frame
+
+
+def read_frame(conn, query, params=None, categories=()):
+    # Built FETCH_CHUNK_ROWS at a time, so the whole result never exists as
+    # one list of tuples next to its arrays, then compacted (see above)
+    cur = conn.cursor()
+    start = time.perf_counter()
+    cur.execute(query, params)
+    description = cur.description
+    chunks = []
+    while True:
+        rows = cur.fetchmany(FETCH_CHUNK_ROWS)
+        chunks.append(frame_from_rows(rows, description))
+        if len(rows) < FETCH_CHUNK_ROWS:
+            break
+    cur.close()
+    if query_observer is not None:
+        query_observer(time.perf_counter() - start)
+    frame = chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+    return compact_frame(frame, categories)
+
+
+# -----------------------------
+# CONNECTION POOL
+# -----------------------------
+class ConnectionPool:
+    """Process-wide pool of Postgres connections shared by every session.
+
+    Checkouts block (up to ``checkout_timeout`` seconds) when all ``maxconn``
+    connections are busy instead of failing, idle connections are pinged
+    before being handed out, and broken connections are closed and replaced.
+    Every connection has the result decoders above registered once, when it
+    is opened.
+    """
+
+    def __init__(self, minconn, maxconn, health_check_interval=DEFAULT_HEALTH_CHECK_INTERVAL,
+                 checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+        self.connect_kwargs = connect_kwargs
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        # (connection, last returned at); used LIFO so the warmest connection
+        # is handed out first and the extra ones can go idle
+        self._idle = []
+        self._closed = False
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        register_decoders(conn)
+        return conn
+
+    def _is_alive(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def getconn(self):
+        if self._closed:
+            raise pool.PoolError("connection pool is closed")
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise pool.PoolError(
+                f"no database connection available after {self.checkout_timeout}s"
+            )
+        try:
+            while True:
+                with self._lock:
+                    idle = self._idle.pop() if self._idle else None
+                if idle is None:
+                    return self._connect()
+                conn, last_used = idle
+                if self._is_alive(conn, last_used):
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, broken=False):
+        try:
+            if broken or conn.closed or self._closed:
+                self._discard(conn)
+                return
+            # Never park a connection mid-transaction
+            if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    self._discard(conn)
+                    return
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    def closeall(self):
+        self._closed = True
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def install_pool(make_pool):
+    # Idempotent: every Streamlit rerun calls this, only the first one
+    # connects. make_pool() builds anything with a connection() context
+    # manager (see embedded.EmbeddedPool for the read-only DuckDB backend).
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = make_pool()
+        return _pool
+
+
+def init_pool(minconn=DEFAULT_MIN_CONN, maxconn=DEFAULT_MAX_CONN, **connect_kwargs):
+    return install_pool(lambda: ConnectionPool(minconn, maxconn, **connect_kwargs))
+
+
+def get_pool():
+    if _pool is None:
+        raise RuntimeError("connection pool is not initialised, call db.init_pool() first")
+    return _pool
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection for the duration of a ``with`` block."""
+    with get_pool().connection() as conn:
+        yield conn
+
+
+def run(fn, *args, **kwargs):
+    # fn(conn, *args, **kwargs) on a borrowed connection
+    with connection() as conn:
+        return fn(conn, *args, **kwargs)
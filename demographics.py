@@ -0,0 +1,196 @@
+import pandas as pd
+from psycopg2.extras import execute_values
+
+import db
+
+# Columns the data editor is allowed to write back to "Demographics".
+# Anything else in the grid's edits is rejected before it reaches SQL.
+EDITABLE_COLUMNS = ["TractLowIncome", "TractKids", "TractSeniors", "TractSNAP"]
+
+# Only what the grid shows (plus "id", which the grid uses as the row key)
+DISPLAY_COLUMNS = ["id", "tract_id"] + EDITABLE_COLUMNS
+SORT_COLUMNS = ["id", "tract_id"] + EDITABLE_COLUMNS
+PAGE_SIZE = 10
+
+
+def page_query(after=None, sort="id", descending=False, tract_prefix=None, page_size=PAGE_SIZE):
+    # Keyset (seek) pagination: the next page starts right after the last
+    # (sort value, id) seen, so with the (sort_expr, id) indexes from
+    # indexes.py every page costs the same no matter how deep into the
+    # table it is. Returns (query, params).
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort by {sort}")
+
+    # The metric columns are nullable; NULLs would fall out of the row
+    # comparison, so they sort as -1 (first ascending, last descending)
+    if sort in ("id", "tract_id"):
+        sort_expr = f'"{sort}"'
+    else:
+        sort_expr = f'COALESCE("{sort}", -1)'
+
+    where = []
+    params = []
+    if tract_prefix:
+        escaped = tract_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        # Explicit ESCAPE: Postgres defaults to backslash, DuckDB has no default.
+        # The expression index from indexes.py finds the matching rows, so a
+        # rare prefix no longer means walking the whole table in sort order.
+        where.append('"tract_id"::text LIKE %s ESCAPE \'\\\'')
+        params.append(escaped + "%")
+    if after is not None:
+        op = "<" if descending else ">"
+        if sort == "id":
+            where.append(f'"id" {op} %s')
+            params.append(after[1])
+        else:
+            where.append(f'({sort_expr}, "id") {op} (%s, %s)')
+            params.extend(after)
+
+    direction = "DESC" if descending else "ASC"
+    query = f"""
+        SELECT {", ".join(f'"{col}"' for col in DISPLAY_COLUMNS)}, {sort_expr} AS sort_key
+        FROM "Demographics"
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY {sort_expr} {direction}, "id" {direction}
+        LIMIT %s;
+    """
+    # One extra row tells us whether there is a next page
+    params.append(page_size + 1)
+    return query, params
+
+
+def fetch_page(conn, after=None, sort="id", descending=False, tract_prefix=None, page_size=PAGE_SIZE):
+    # Returns (page, cursor for the next page or None)
+    query, params = page_query(after, sort, descending, tract_prefix, page_size)
+    cur = conn.cursor()
+    results = db.fetch_all(cur, query, params)
+    description = cur.description
+    cols = [desc[0] for desc in description]
+    cur.close()
+
+    next_after = None
+    if len(results) > page_size:
+        # Raw tuple values, so the cursor goes straight back into execute()
+        last = results[page_size - 1]
+        next_after = (last[cols.index("sort_key")], last[cols.index("id")])
+    page = db.frame_from_rows(results[:page_size], description)
+    return page.drop(columns="sort_key"), next_after
+
+
+def fetch_rows(conn, ids):
+    # The grid's columns for these ids, as they are now
+    query = f"""
+        SELECT {", ".join(f'"{col}"' for col in DISPLAY_COLUMNS)}
+        FROM "Demographics"
+        WHERE "id" = ANY(%s);
+    """
+    return db.read_frame(conn, query, (list(ids),))
+
+
+def patch_page(page, rows, sort, tract_prefix=None):
+    # A cached grid page with the new values of rows (DISPLAY_COLUMNS)
+    # written in: the page itself if none of them is on it, or None when
+    # they may have moved rows onto or off it, as it is sorted or filtered
+    # by a column they changed. Rows not on the page are taken to have kept
+    # their tract_id (notify.py only sends ids when that holds). Plain lists
+    # throughout: a page is a handful of rows, where pandas' per-call
+    # overhead would dominate.
+    columns = ["tract_id"] + EDITABLE_COLUMNS
+    new_values = dict(zip(rows["id"].tolist(), zip(*(rows[col].tolist() for col in columns))))
+    ids = page["id"].tolist()
+    on_page = [row_id for row_id in ids if row_id in new_values]
+    order_columns = [sort] if sort in columns else []
+    if tract_prefix:
+        order_columns.append("tract_id")
+    if sort in EDITABLE_COLUMNS and len(on_page) < len(new_values):
+        # A row from another page may now sort onto this one
+        return None
+    for col in order_columns:
+        j = columns.index(col)
+        for row_id, old in zip(ids, page[col].tolist()):
+            if row_id in new_values and not _same(old, new_values[row_id][j]):
+                return None
+    if not on_page:
+        return page
+    patched = page.copy()
+    for j, col in enumerate(columns):
+        patched[col] = [new_values[row_id][j] if row_id in new_values else value
+                        for row_id, value in zip(ids, page[col].tolist())]
+    return patched
+
+
+def _same(old, new):
+    return old == new or (pd.isna(old) and pd.isna(new))
+
+
+def saved_rows(page, edits):
+    # The rows of a grid page that edits ({id: {column: value}}) changed,
+    # with their saved values, for patch_page()
+    rows = page[page["id"].isin(list(edits))]
+    ids = rows["id"].tolist()
+    return rows.assign(**{
+        col: [edits[row_id].get(col, value) for row_id, value in zip(ids, rows[col].tolist())]
+        for col in EDITABLE_COLUMNS
+    })
+
+
+def collect_edits(demographics_table, grid_edits):
+    # grid_edits is what the grid's cell edits recorded, {id: {column: new
+    # value}}; returns the same with the ids checked against the page and
+    # the values as numbers (or None for a cleared cell)
+    page_ids = set(demographics_table["id"].tolist())
+    edits = {}
+    for row_id, row_changes in grid_edits.items():
+        unknown = set(row_changes) - set(EDITABLE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Columns not editable: {', '.join(sorted(unknown))}")
+        if int(row_id) not in page_ids:
+            raise ValueError(f"Row {row_id} is not on this page")
+        edits[int(row_id)] = {col: _number(col, value) for col, value in row_changes.items()}
+    return edits
+
+
+def _number(col, value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{col} must be a number, not {value!r}") from None
+
+
+def save_edits(conn, edits):
+    # One UPDATE ... FROM (VALUES ...) for the whole edit session, in one
+    # transaction. Each row carries a "was this column edited" flag next to
+    # the new value so untouched columns keep their current value (and an
+    # explicit NULL can still be written).
+    if not edits:
+        return 0
+
+    rows = []
+    for row_id, changes in edits.items():
+        row = [row_id]
+        for col in EDITABLE_COLUMNS:
+            row.append(col in changes)
+            row.append(changes.get(col))
+        rows.append(tuple(row))
+
+    value_columns = ", ".join(f'set_{i}, val_{i}' for i in range(len(EDITABLE_COLUMNS)))
+    template = "(%s::bigint" + ", %s::boolean, %s::numeric" * len(EDITABLE_COLUMNS) + ")"
+    set_clauses = ",\n            ".join(
+        f'"{col}" = CASE WHEN v.set_{i} THEN v.val_{i} ELSE d."{col}" END'
+        for i, col in enumerate(EDITABLE_COLUMNS)
+    )
+    query = f"""
+        UPDATE "Demographics" AS d
+        SET
+            {set_clauses}
+        FROM (VALUES %s) AS v(id, {value_columns})
+        WHERE d."id" = v.id
+    """
+
+    with conn:
+        cur = conn.cursor()
+        execute_values(cur, query, rows, template=template, page_size=len(rows))
+        cur.close()
+    return len(rows)
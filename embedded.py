@@ -0,0 +1,221 @@
+import collections
+import os
+import re
+import sys
+import threading
+from contextlib import contextmanager
+
+import duckdb
+
+import db
+
+# Read-only copy of the dashboard's data in an embedded DuckDB file.
+#
+#   python embedded.py export PATH    copy what the dashboard reads out of Postgres
+#
+# With BACKEND = "embedded" in the secrets the app runs the same queries
+# (queries.py, demographics.py, rollups.current_version) against that file
+# instead of Postgres: read replicas scale out without touching the primary,
+# and a demo or air-gapped deployment needs no database server at all.
+# Everything is read-only; saving grid edits is disabled in that mode.
+#
+# The file holds one consistent snapshot of the tables below, including the
+# rollup_version stamp, so the Arrow snapshots and every cache key work the
+# same way as against Postgres. Re-export and restart (or redeploy) the
+# replicas to pick up new data.
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "foodreach.duckdb")
+
+# Every table or rollup a dashboard query reads, in the "public" schema like
+# in Postgres so the SQL runs unchanged
+EXPORT_TABLES = [
+    "State", "County", "county_rollup", "state_rollup", "rollup_version",
+    "Demographics", "CensusTract", "LowAccess1Mile", "FoodAccessIndicator",
+]
+# Stored in key order, so DuckDB's per-block min/max let a lookup by key (or
+# by a tract_id prefix) skip most of the table
+EXPORT_ORDER = {
+    "Demographics": "id",
+    "CensusTract": "tract_id",
+    "LowAccess1Mile": "tract_id",
+    "FoodAccessIndicator": "tract_id",
+}
+EXPORT_BATCH_ROWS = 50000
+
+
+# -----------------------------
+# EXPORT
+# -----------------------------
+def _export_table(conn, duck, table):
+    # Streamed batch by batch, so a large table is never held in memory
+    order = f' ORDER BY "{EXPORT_ORDER[table]}"' if table in EXPORT_ORDER else ""
+    batches = db.stream_batches(conn, f'SELECT * FROM public."{table}"{order};',
+                                batch_rows=EXPORT_BATCH_ROWS, name=f"export_{table.lower()}")
+    rows = 0
+    for i, batch in enumerate(batches):
+        duck.register("export_batch", batch)
+        if i == 0:
+            duck.execute(f'CREATE TABLE public."{table}" AS SELECT * FROM export_batch;')
+        else:
+            duck.execute(f'INSERT INTO public."{table}" SELECT * FROM export_batch;')
+        duck.unregister("export_batch")
+        rows += batch.num_rows
+    return rows
+
+
+def export(conn, path):
+    # All tables come from one REPEATABLE READ snapshot, so the rollups,
+    # the version stamp and the Demographics rows agree with each other
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn.rollback()
+    cur = conn.cursor()
+    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY;")
+    cur.close()
+
+    counts = {}
+    duck = duckdb.connect(tmp_path)
+    try:
+        duck.execute("CREATE SCHEMA public;")
+        for table in EXPORT_TABLES:
+            counts[table] = _export_table(conn, duck, table)
+        duck.execute("CHECKPOINT;")
+    finally:
+        duck.close()
+        conn.rollback()
+
+    # Swap the new file in whole, like snapshot.write_snapshot()
+    os.replace(tmp_path, path)
+    return counts
+
+
+# -----------------------------
+# READ-ONLY POOL
+# -----------------------------
+Column = collections.namedtuple("Column", ["name", "type_code"])
+
+# DuckDB type name -> the Postgres OID db.frame_from_rows() decodes it as
+_INT_TYPES = {"TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT"}
+_FLOAT_TYPES = {"FLOAT", "DOUBLE"}
+TEXT_OID = 25
+
+# psycopg2 placeholders -> DuckDB's; "%%" is a literal percent sign
+_PLACEHOLDER = re.compile(r"%%|%s")
+
+
+def _type_code(duck_type):
+    name = str(duck_type)
+    if name in _INT_TYPES:
+        return 20
+    if name in _FLOAT_TYPES:
+        return 701
+    if name.startswith("DECIMAL"):
+        return db.NUMERIC_OID
+    return TEXT_OID
+
+
+class EmbeddedCursor:
+    """The part of the psycopg2 cursor interface the dashboard queries use."""
+
+    def __init__(self, duck):
+        self._duck = duck
+
+    def execute(self, query, params=None):
+        query = _PLACEHOLDER.sub(lambda m: "%" if m.group() == "%%" else "?", query)
+        self._duck.execute(query, list(params) if params is not None else None)
+
+    def fetchone(self):
+        return self._duck.fetchone()
+
+    def fetchmany(self, size):
+        return self._duck.fetchmany(size)
+
+    def fetchall(self):
+        return self._duck.fetchall()
+
+    @property
+    def description(self):
+        description = self._duck.description
+        if description is None:
+            return None
+        return [Column(desc[0], _type_code(desc[1])) for desc in description]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class EmbeddedConnection:
+    def __init__(self, duck):
+        self._duck = duck
+
+    def cursor(self):
+        return EmbeddedCursor(self._duck)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class EmbeddedPool:
+    """Stands in for db.ConnectionPool over a read-only DuckDB file.
+
+    The file is opened once per process. Every checkout gets its own DuckDB
+    cursor (DuckDB's per-thread handle on the same database), so the
+    dashboard's concurrent loaders can run side by side as they do against
+    the Postgres pool.
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"no embedded database at {path}, run `python embedded.py export {path}` first")
+        self.path = path
+        self._duck = duckdb.connect(path, read_only=True)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            duck = self._duck.cursor()
+        try:
+            duck.execute("SET schema = 'public';")
+            yield EmbeddedConnection(duck)
+        finally:
+            duck.close()
+
+    def closeall(self):
+        self._duck.close()
+
+
+def init_pool(path=DEFAULT_PATH):
+    # Idempotent like db.init_pool(); db.connection() and db.run() then read
+    # from the embedded file
+    return db.install_pool(lambda: EmbeddedPool(path))
+
+
+def main(argv):
+    if len(argv) not in (2, 3) or argv[1] != "export":
+        print(f"usage: python {argv[0]} export [PATH]")
+        return 2
+
+    path = argv[2] if len(argv) == 3 else DEFAULT_PATH
+    db.init_pool(**db.settings_from_env())
+    with db.connection() as conn:
+        counts = export(conn, path)
+    for table, count in counts.items():
+        print(f"{table:<20} {count:>10,} rows")
+    print(f"export: wrote {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
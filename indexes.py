@@ -0,0 +1,333 @@
+import argparse
+import json
+import sys
+
+import db
+import demographics
+import queries
+import tract_export
+import tracts
+
+# Indexes behind the dashboard's join paths, and a check that its queries
+# actually use them.
+#
+#   python indexes.py migrate            apply the pending index migrations
+#   python indexes.py check [--strict]   EXPLAIN (ANALYZE) every app query
+#
+# Every aggregate walks State -> County -> CensusTract -> LowAccess1Mile /
+# FoodAccessIndicator on state_id, county_id and tract_id. MIGRATIONS below
+# are applied in order, once each, and recorded in public.schema_migrations.
+#
+# `check` reads the live schema and the plans of the app's queries on the
+# live data and reports foreign keys without an index, sequential scans
+# that filter a large table, index scans that discard most of the rows they
+# read, pages that sort a whole table, row estimates
+# far off the actual counts and migrations not applied yet. It exits 1 when
+# it finds any of these (misestimates only count with --strict), so it can
+# gate a deploy.
+
+# Tables smaller than this are cheaper to scan than to index
+SEQ_SCAN_MIN_ROWS = 10000
+# Estimated vs actual rows, either way round
+MISESTIMATE_FACTOR = 10
+MISESTIMATE_MIN_ROWS = 1000
+
+# (version, name, SQL). Append only: an applied migration is never re-run,
+# so change an index by adding a migration that drops and recreates it.
+MIGRATIONS = [
+    (1, "join path indexes", """
+        -- Foreign keys on the join paths; the tract ones cover tract_id so
+        -- a county's tracts are read from the index alone
+        CREATE INDEX IF NOT EXISTS county_state_id_idx
+            ON public."County" (state_id) INCLUDE (county_id);
+        DROP INDEX IF EXISTS public.censustract_county_id_idx;
+        CREATE INDEX IF NOT EXISTS censustract_county_id_tract_idx
+            ON public."CensusTract" (county_id) INCLUDE (tract_id);
+        CREATE INDEX IF NOT EXISTS demographics_tract_id_idx
+            ON public."Demographics" (tract_id);
+        CREATE INDEX IF NOT EXISTS state_state_name_idx
+            ON public."State" (state_name) INCLUDE (state_id);
+    """),
+    (2, "demographics keyset sort indexes", "\n".join(
+        # Same expression and tie-breaker as demographics.page_query(), so a
+        # sorted page is an index range scan instead of a sort of the table
+        f'CREATE INDEX IF NOT EXISTS demographics_{col.lower()}_page_idx '
+        f'ON public."Demographics" ((COALESCE("{col}", -1)), id);'
+        for col in demographics.EDITABLE_COLUMNS
+    ) + '\nCREATE INDEX IF NOT EXISTS demographics_tract_id_page_idx ON public."Demographics" (tract_id, id);'),
+    (3, "demographics tract prefix index", """
+        -- The grid's "Tract ID starts with" filter, same expression as
+        -- demographics.page_query(); text_pattern_ops lets LIKE 'prefix%'
+        -- use it whatever the database's collation
+        CREATE INDEX IF NOT EXISTS demographics_tract_id_prefix_idx
+            ON public."Demographics" (("tract_id"::text) text_pattern_ops);
+        -- The planner only knows how selective a prefix is once the
+        -- expression has statistics
+        ANALYZE public."Demographics";
+    """),
+]
+
+migrations_table_sql = """
+CREATE TABLE IF NOT EXISTS public.schema_migrations (
+    version integer PRIMARY KEY,
+    name text NOT NULL,
+    applied_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+# Any key for pg_advisory_xact_lock, so two replicas never migrate at once
+MIGRATION_LOCK = 7318_2201
+
+# Foreign keys in public whose columns do not lead any index on their table
+unindexed_foreign_keys_sql = """
+SELECT
+    con.conrelid::regclass::text,
+    con.conname,
+    array_agg(att.attname ORDER BY k.ord)
+FROM
+    pg_constraint con
+CROSS JOIN LATERAL
+    unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+JOIN
+    pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = k.attnum
+WHERE
+    con.contype = 'f'
+    AND con.connamespace = 'public'::regnamespace
+    AND NOT EXISTS (
+        SELECT 1 FROM pg_index i
+        WHERE i.indrelid = con.conrelid
+          AND (string_to_array(i.indkey::text, ' ')::int2[])[1:cardinality(con.conkey)] @> con.conkey
+          AND (string_to_array(i.indkey::text, ' ')::int2[])[1:cardinality(con.conkey)] <@ con.conkey
+    )
+GROUP BY
+    con.conrelid, con.conname;
+"""
+
+# The last tract's first digits: a prefix whose rows an id-ordered walk
+# reaches last
+sample_prefix_sql = """
+SELECT left(MAX("tract_id")::text, 5) FROM "public"."Demographics";
+"""
+
+sample_keys_sql = """
+SELECT ct.county_id, c.state_id
+FROM "public"."CensusTract" ct
+JOIN "public"."County" c ON c.county_id = ct.county_id
+GROUP BY ct.county_id, c.state_id
+ORDER BY COUNT(*) DESC
+LIMIT 1;
+"""
+
+
+# -----------------------------
+# MIGRATIONS
+# -----------------------------
+def applied_versions(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('public.schema_migrations') IS NOT NULL;")
+    versions = set()
+    if cur.fetchone()[0]:
+        cur.execute("SELECT version FROM public.schema_migrations;")
+        versions = {row[0] for row in cur.fetchall()}
+    cur.close()
+    conn.rollback()
+    return versions
+
+
+def pending_migrations(conn):
+    applied = applied_versions(conn)
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def migrate(conn):
+    # Each migration commits on its own, so a failure keeps the ones before
+    # it. Returns the (version, name) pairs applied.
+    done = []
+    cur = conn.cursor()
+    cur.execute(migrations_table_sql)
+    conn.commit()
+    for version, name, sql in MIGRATIONS:
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK,))
+        cur.execute("SELECT 1 FROM public.schema_migrations WHERE version = %s;", (version,))
+        if cur.fetchone() is None:
+            cur.execute(sql)
+            cur.execute("INSERT INTO public.schema_migrations (version, name) VALUES (%s, %s);", (version, name))
+            done.append((version, name))
+        conn.commit()
+    cur.close()
+    return done
+
+
+# -----------------------------
+# CHECK
+# -----------------------------
+def app_queries(conn):
+    # Name -> (SQL, params) for everything the dashboard runs against
+    # Postgres, with a large county (and its state) as the sample parameters
+    cur = conn.cursor()
+    cur.execute(sample_keys_sql)
+    county_id, state_id = cur.fetchone() or (0, 0)
+    cur.execute(sample_prefix_sql)
+    tract_prefix = cur.fetchone()[0] or "0"
+    # The rollups' defining queries, as installed
+    cur.execute("SELECT matviewname, definition FROM pg_matviews WHERE schemaname = 'public';")
+    rollups = dict(cur.fetchall())
+    cur.close()
+    conn.rollback()
+
+    checked = {name: (sql, None) for name, sql in queries.APP_QUERIES.items()}
+    for view in ("county_rollup", "state_rollup"):
+        if view in rollups:
+            checked[f"refresh:{view}"] = (rollups[view], None)
+    checked["demographics:first_page"] = demographics.page_query()
+    for col in demographics.EDITABLE_COLUMNS:
+        checked[f"demographics:sorted_by_{col}"] = demographics.page_query(sort=col, descending=True)
+    checked["demographics:tract_prefix"] = demographics.page_query(tract_prefix=tract_prefix)
+    checked["demographics:tract_prefix_sorted"] = demographics.page_query(
+        sort=demographics.EDITABLE_COLUMNS[0], descending=True, tract_prefix=tract_prefix)
+    checked["tracts:county"] = (tracts.county_tracts_sql, (county_id,))
+    checked["tracts:top"] = (tracts.top_tracts_sql.format(metric=demographics.EDITABLE_COLUMNS[0]),
+                             (county_id, tracts.RADAR_TOP_K))
+    checked["export:state"] = tract_export.export_query(state_id=state_id)
+    checked["export:county"] = tract_export.export_query(state_id=state_id, county_id=county_id)
+    return checked
+
+
+def explain(conn, sql, params=None, analyze=True):
+    # The plan as JSON; ANALYZE runs the query, inside a transaction that is
+    # rolled back
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    cur = conn.cursor()
+    try:
+        cur.execute(f"EXPLAIN ({options}) {sql.strip().rstrip(';')}", params)
+        plan = cur.fetchone()[0]
+    finally:
+        cur.close()
+        conn.rollback()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def table_rows(conn):
+    # Planner's row counts for every table in public
+    cur = conn.cursor()
+    cur.execute("SELECT relname, reltuples FROM pg_class "
+                "WHERE relnamespace = 'public'::regnamespace AND relkind IN ('r', 'm');")
+    rows = {name: max(count, 0) for name, count in cur.fetchall()}
+    cur.close()
+    conn.rollback()
+    return rows
+
+
+def _nodes(node, under_limit=False):
+    # Every plan node, and whether a LIMIT sits somewhere above it
+    yield node, under_limit
+    for child in node.get("Plans", []):
+        yield from _nodes(child, under_limit or node["Node Type"] == "Limit")
+
+
+def plan_findings(plan, rows_by_table):
+    # (severity, message) for one query's plan; "error" fails the check,
+    # "warning" only with --strict
+    findings = []
+    for node, under_limit in _nodes(plan["Plan"]):
+        node_type = node["Node Type"]
+        table = node.get("Relation Name")
+        if node_type == "Seq Scan" and rows_by_table.get(table, 0) >= SEQ_SCAN_MIN_ROWS and "Filter" in node:
+            removed = node.get("Rows Removed by Filter")
+            findings.append(("error", f'Seq Scan on {table} filtered by {node["Filter"]}'
+                                      + (f" ({removed:,} rows removed)" if removed is not None else "")))
+        # An index walk that throws most of what it reads away, e.g. a page
+        # in id order looking for a few matching rows
+        removed = node.get("Rows Removed by Filter", 0) * max(node.get("Actual Loops", 1), 1)
+        if node_type != "Seq Scan" and removed >= SEQ_SCAN_MIN_ROWS:
+            findings.append(("error", f'{node_type}{" on " + table if table else ""} '
+                                      f'discards {removed:,.0f} rows by {node["Filter"]}'))
+        if (node_type == "Sort" and under_limit
+                and node["Plans"][0].get("Actual Rows", node["Plans"][0]["Plan Rows"]) >= SEQ_SCAN_MIN_ROWS):
+            findings.append(("error", f'sorts every row for a LIMIT on {", ".join(node["Sort Key"])}'))
+        # Under a LIMIT a node stops early, so its full estimate is expected
+        if "Actual Rows" in node and not under_limit:
+            loops = max(node.get("Actual Loops", 1), 1)
+            actual = node["Actual Rows"] * loops
+            estimated = node["Plan Rows"] * loops
+            low, high = sorted((actual, estimated))
+            if high >= MISESTIMATE_MIN_ROWS and high > MISESTIMATE_FACTOR * max(low, 1):
+                findings.append(("warning", f"{node_type}{' on ' + table if table else ''}: "
+                                            f"estimated {estimated:,.0f} rows, actual {actual:,.0f}"
+                                            + ("; statistics may be stale, try ANALYZE" if table else "")))
+    return findings
+
+
+def schema_findings(conn):
+    cur = conn.cursor()
+    cur.execute(unindexed_foreign_keys_sql)
+    rows = cur.fetchall()
+    cur.close()
+    conn.rollback()
+    findings = [("error", f"foreign key {name} on {table} ({', '.join(cols)}) has no index")
+                for table, name, cols in rows]
+    findings.extend(("error", f"migration {version} ({name}) not applied")
+                    for version, name, _ in pending_migrations(conn))
+    return findings
+
+
+def check(conn, analyze=True):
+    # {"schema": [...], query name: {"ms": ..., "findings": [...]}}
+    report = {"schema": {"findings": schema_findings(conn)}}
+    rows_by_table = table_rows(conn)
+    for name, (sql, params) in app_queries(conn).items():
+        plan = explain(conn, sql, params, analyze)
+        report[name] = {
+            "ms": plan.get("Execution Time"),
+            "findings": plan_findings(plan, rows_by_table),
+        }
+    return report
+
+
+def format_report(report):
+    lines = []
+    for name, entry in report.items():
+        timing = f"{entry['ms']:>10.2f} ms" if entry.get("ms") is not None else " " * 13
+        status = "ok" if not entry["findings"] else f"{len(entry['findings'])} finding(s)"
+        lines.append(f"{name:<36} {timing}  {status}")
+        for severity, message in entry["findings"]:
+            lines.append(f"    {severity}: {message}")
+    return "\n".join(lines)
+
+
+def failed(report, strict=False):
+    severities = {"error", "warning"} if strict else {"error"}
+    return any(severity in severities for entry in report.values() for severity, _ in entry["findings"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python indexes.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="apply the pending index migrations")
+    checker = commands.add_parser("check", help="report plans that miss an index")
+    checker.add_argument("--no-analyze", action="store_true", help="plan only, do not run the queries")
+    checker.add_argument("--strict", action="store_true", help="fail on row misestimates too")
+    checker.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    db.init_pool(**db.settings_from_env())
+    with db.connection() as conn:
+        if args.command == "migrate":
+            done = migrate(conn)
+            for version, name in done:
+                print(f"migrate: applied {version} ({name})")
+            print(f"migrate: {len(MIGRATIONS) - len(done)} already applied, {len(done)} applied now")
+            return 0
+        report = check(conn, analyze=not args.no_analyze)
+
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if failed(report, args.strict) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
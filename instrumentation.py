@@ -0,0 +1,267 @@
+import collections
+import functools
+import json
+import threading
+import time
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import db
+
+# Opt-in timing for loaders, chart payloads and dashboard sections.
+#
+# Every measured call becomes one record: wall time, time spent in Postgres,
+# rows returned, payload bytes sent to the browser and whether the call was
+# served from cache, tagged with the session and the rerun it belongs to.
+# Records are kept in a bounded in-process buffer and can be exported as JSON
+# lines or Prometheus text. When disabled every hook is a plain pass-through.
+
+MAX_RECORDS = 10000
+# Run counters are kept for at most this many sessions; past it, sessions
+# with no records left in the buffer are forgotten
+MAX_SESSIONS = 1000
+
+enabled = False
+
+_records = collections.deque(maxlen=MAX_RECORDS)
+_records_lock = threading.Lock()
+_current_run = {}
+_spans = threading.local()
+
+
+def configure(enable):
+    global enabled
+    enabled = bool(enable)
+    db.query_observer = add_db_time if enabled else None
+
+
+def _session_id():
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else "local"
+
+
+def begin_run():
+    # Called once at the top of every full rerun, and by timed() when a
+    # fragment reruns on its own; returns the new run number
+    session_id = _session_id()
+    with _records_lock:
+        run = _current_run[session_id] = _current_run.get(session_id, 0) + 1
+        if len(_current_run) > MAX_SESSIONS:
+            _prune_runs()
+    return run
+
+
+def _prune_runs():
+    # Under _records_lock. A session's run number only matters while it
+    # still has records; a session that comes back starts over at 1
+    live = {r["session"] for r in _records}
+    live.add(_session_id())
+    for session_id in [s for s in _current_run if s not in live]:
+        del _current_run[session_id]
+
+
+def _fragment_rerun():
+    # True when Streamlit is rerunning fragments only, not the whole script
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx is not None and bool(ctx.fragment_ids_this_run)
+
+
+def _stack():
+    if not hasattr(_spans, "stack"):
+        _spans.stack = []
+    return _spans.stack
+
+
+class Span:
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.db_seconds = 0.0
+        self.rows = None
+        self.payload_bytes = None
+        self.cache = None
+
+    def record(self, wall_seconds, error=None):
+        session_id = _session_id()
+        record = {
+            "ts": time.time(),
+            "session": session_id,
+            "run": _current_run.get(session_id, 0),
+            "name": self.name,
+            "kind": self.kind,
+            "wall_ms": round(wall_seconds * 1000, 3),
+            "db_ms": round(self.db_seconds * 1000, 3),
+            "rows": self.rows,
+            "payload_bytes": self.payload_bytes,
+            "cache": self.cache,
+            "error": error,
+        }
+        with _records_lock:
+            _records.append(record)
+
+
+class _NullSpan:
+    # Stand-in so callers can set attributes without checking `enabled`
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class span:
+    """``with span("state_dashboard", "section") as s:`` times a block."""
+
+    def __init__(self, name, kind="section"):
+        self.name = name
+        self.kind = kind
+
+    def __enter__(self):
+        if not enabled:
+            return _NULL_SPAN
+        self._span = Span(self.name, self.kind)
+        self._start = time.perf_counter()
+        _stack().append(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if not enabled:
+            return False
+        _stack().pop()
+        self._span.record(time.perf_counter() - self._start, error=repr(exc) if exc else None)
+        return False
+
+
+def current():
+    stack = _stack()
+    return stack[-1] if enabled and stack else _NULL_SPAN
+
+
+def add_db_time(seconds):
+    # Called for every query run through db.fetch_all(); charged to every
+    # open span on this thread
+    if enabled:
+        for open_span in _stack():
+            open_span.db_seconds += seconds
+
+
+def _count_rows(result):
+    if isinstance(result, tuple):
+        result = result[0]
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+def loader(name):
+    """Outermost decorator on a cached loader: wall time, rows, hit or miss.
+
+    Pair it with ``@cache_miss`` directly on the function body, underneath
+    the cache decorator; if the body runs the call was a miss.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with span(name, "loader") as s:
+                s.cache = "hit"
+                result = fn(*args, **kwargs)
+                s.rows = _count_rows(result)
+                return result
+        # Keep the cache's .clear() (and .invalidate()) reachable through the wrapper
+        for method in ("clear", "invalidate"):
+            if hasattr(fn, method):
+                setattr(wrapper, method, getattr(fn, method))
+        return wrapper
+    return decorate
+
+
+def timed(name, kind="section"):
+    """Times every call; on a fragment, also starts a new run.
+
+    A fragment rerun does not execute the top of the script, so the
+    outermost timed section of one starts the run itself. Nested fragments
+    run inside their parent's span and belong to its run.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if enabled and kind == "section" and not _stack() and _fragment_rerun():
+                begin_run()
+            with span(name, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def cache_miss(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        current().cache = "miss"
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def payload(name, data):
+    # Size of a chart or grid payload as it will be serialised to the browser
+    if enabled:
+        with span(name, "payload") as s:
+            s.payload_bytes = len(json.dumps(data, default=str))
+            s.rows = len(data) if hasattr(data, "__len__") else None
+    return data
+
+
+# -----------------------------
+# EXPORT
+# -----------------------------
+def records(session=None, run=None):
+    with _records_lock:
+        snapshot = list(_records)
+    return [
+        r for r in snapshot
+        if (session is None or r["session"] == session) and (run is None or r["run"] == run)
+    ]
+
+
+def current_session_records(last_run_only=False):
+    session_id = _session_id()
+    with _records_lock:
+        run = _current_run.get(session_id) if last_run_only else None
+    return records(session=session_id, run=run)
+
+
+def to_jsonl(rows=None):
+    rows = records() if rows is None else rows
+    return "".join(json.dumps(r) + "\n" for r in rows)
+
+
+def to_prometheus(rows=None):
+    rows = records() if rows is None else rows
+    totals = collections.defaultdict(collections.Counter)
+    for r in rows:
+        key = (r["name"], r["kind"])
+        totals[key]["count"] += 1
+        totals[key]["wall_seconds"] += r["wall_ms"] / 1000
+        totals[key]["db_seconds"] += r["db_ms"] / 1000
+        totals[key]["rows"] += r["rows"] or 0
+        totals[key]["payload_bytes"] += r["payload_bytes"] or 0
+        if r["cache"]:
+            totals[key][f"cache_{r['cache']}"] += 1
+
+    metrics = [
+        ("dashboard_calls_total", "counter", "count"),
+        ("dashboard_wall_seconds_total", "counter", "wall_seconds"),
+        ("dashboard_db_seconds_total", "counter", "db_seconds"),
+        ("dashboard_rows_total", "counter", "rows"),
+        ("dashboard_payload_bytes_total", "counter", "payload_bytes"),
+        ("dashboard_cache_hits_total", "counter", "cache_hit"),
+        ("dashboard_cache_misses_total", "counter", "cache_miss"),
+    ]
+    lines = []
+    for metric, metric_type, field in metrics:
+        lines.append(f"# TYPE {metric} {metric_type}")
+        for (name, kind), counter in sorted(totals.items()):
+            lines.append(f'{metric}{{name="{name}",kind="{kind}"}} {counter[field]:g}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,260 @@
+import logging
+import select
+import sys
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+import db
+import demographics
+
+# Change notifications for the tables the dashboard caches.
+#
+#   python notify.py setup      install the triggers (idempotent)
+#
+# Every INSERT/UPDATE/DELETE/TRUNCATE on a watched table sends
+# NOTIFY dashboard_changes, '<table name>' once per statement, whoever made
+# the change. Each app process keeps one listening connection and evicts only
+# the cached datasets that depend on that table, so caches can live until
+# the data actually changes, on every replica.
+#
+# An UPDATE of a table in ROW_TABLES sends '<table name>:<id>,<id>,...'
+# instead, so listeners can patch just those rows in place. That is only
+# sound while the update changed nothing but the patchable columns: when
+# any other column changed (a row moved to another tract, or its key
+# changed), or past MAX_NOTIFY_IDS rows, it falls back to the table name.
+#
+# LISTEN needs a session-level connection: through a transaction pooler
+# (e.g. Supabase's on port 6543) the listening backend is handed to other
+# clients after every statement and notifications never arrive. The app
+# connects its listener to LISTEN_HOST/LISTEN_PORT for that reason, and the
+# listener checks delivery with a probe notification after connecting.
+
+CHANNEL = "dashboard_changes"
+WATCHED_TABLES = ["Demographics", "CensusTract", "LowAccess1Mile", "FoodAccessIndicator", "County", "State", "rollup_version"]
+# Table -> (key column sent with its updates, columns listeners patch in place)
+ROW_TABLES = {"Demographics": ("id", demographics.EDITABLE_COLUMNS)}
+# NOTIFY payloads are capped at 8000 bytes
+MAX_NOTIFY_IDS = 500
+RECONNECT_DELAY = 5
+# Seconds between "anything may have changed" calls, the consistency check
+# behind the row-level updates
+RESYNC_INTERVAL = 15 * 60
+# Sent by the listener to itself after LISTEN; when it has not come back
+# within PROBE_TIMEOUT seconds notifications are not being delivered, and the
+# listener resyncs every FALLBACK_RESYNC_INTERVAL seconds instead
+PROBE_PAYLOAD = "__probe__"
+PROBE_TIMEOUT = 30
+FALLBACK_RESYNC_INTERVAL = 60
+
+logger = logging.getLogger(__name__)
+
+notify_function_sql = f"""
+CREATE OR REPLACE FUNCTION public.dashboard_notify_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{CHANNEL}', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+notify_rows_function_sql = f"""
+CREATE OR REPLACE FUNCTION public.dashboard_notify_rows() RETURNS trigger AS $$
+DECLARE
+    updated bigint;
+    ids text;
+    other_changes boolean;
+BEGIN
+    -- TG_ARGV[0] is the key column, the rest the patchable columns; the
+    -- statement's rows are old_rows and new_rows
+    EXECUTE format(
+        'SELECT count(*), string_agg(%1$I::text, '','') FROM (SELECT %1$I FROM new_rows LIMIT {MAX_NOTIFY_IDS + 1}) r',
+        TG_ARGV[0]
+    ) INTO updated, ids;
+    -- Rows whose key changed, or any column outside the patchable ones
+    EXECUTE format(
+        'SELECT EXISTS (SELECT 1 FROM new_rows n LEFT JOIN old_rows o ON o.%1$I = n.%1$I '
+        'WHERE o.%1$I IS NULL OR to_jsonb(o) - $1 IS DISTINCT FROM to_jsonb(n) - $1)',
+        TG_ARGV[0]
+    ) INTO other_changes USING TG_ARGV[1:];
+    IF updated > {MAX_NOTIFY_IDS} OR other_changes THEN
+        PERFORM pg_notify('{CHANNEL}', TG_TABLE_NAME);
+    ELSIF updated > 0 THEN
+        PERFORM pg_notify('{CHANNEL}', TG_TABLE_NAME || ':' || ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+notify_trigger_sql = """
+DROP TRIGGER IF EXISTS dashboard_notify_change ON public."{table}";
+CREATE TRIGGER dashboard_notify_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public."{table}"
+    FOR EACH STATEMENT EXECUTE FUNCTION public.dashboard_notify_change();
+"""
+
+# A trigger with a transition table can only fire on one kind of event
+notify_rows_trigger_sql = """
+DROP TRIGGER IF EXISTS dashboard_notify_change ON public."{table}";
+CREATE TRIGGER dashboard_notify_change
+    AFTER INSERT OR DELETE OR TRUNCATE ON public."{table}"
+    FOR EACH STATEMENT EXECUTE FUNCTION public.dashboard_notify_change();
+DROP TRIGGER IF EXISTS dashboard_notify_rows ON public."{table}";
+CREATE TRIGGER dashboard_notify_rows
+    AFTER UPDATE ON public."{table}"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.dashboard_notify_rows({args});
+"""
+
+
+def setup(conn):
+    cur = conn.cursor()
+    cur.execute(notify_function_sql)
+    cur.execute(notify_rows_function_sql)
+    for table in WATCHED_TABLES:
+        if table in ROW_TABLES:
+            key, patchable = ROW_TABLES[table]
+            args = ", ".join(f"'{col}'" for col in [key] + patchable)
+            cur.execute(notify_rows_trigger_sql.format(table=table, args=args))
+        else:
+            cur.execute(notify_trigger_sql.format(table=table))
+    cur.close()
+    conn.commit()
+
+
+def parse_payload(payload):
+    # '<table>' -> (table, None); '<table>:1,2' -> (table, [1, 2])
+    table, _, ids = payload.partition(":")
+    return table, ([int(i) for i in ids.split(",")] if ids else None)
+
+
+class ChangeListener:
+    """Background thread that LISTENs on CHANNEL and calls on_change(table, ids).
+
+    ids lists the updated keys of a ROW_TABLES table, or is None when any
+    row may have changed. Notifications sent while the connection is down
+    are lost, so after every (re)connect, and every resync_interval seconds,
+    on_change is called once with (None, None), meaning "assume anything
+    may have changed". When the connection does not deliver notifications
+    (see PROBE_PAYLOAD) it logs a warning and resyncs every
+    FALLBACK_RESYNC_INTERVAL seconds, so caches go stale for a minute at most.
+    """
+
+    def __init__(self, connect_kwargs, on_change, poll_interval=5, resync_interval=RESYNC_INTERVAL):
+        self.connect_kwargs = connect_kwargs
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.resync_interval = resync_interval
+        # None until this connection's probe came back (True) or timed out (False)
+        self.delivering = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="dashboard-listener", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        first = True
+        while not self._stop.is_set():
+            try:
+                conn = psycopg2.connect(**self.connect_kwargs)
+            except psycopg2.Error as e:
+                logger.warning("change listener could not connect: %s", e)
+                self._stop.wait(RECONNECT_DELAY)
+                continue
+            try:
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {CHANNEL};")
+                cur.execute("SELECT pg_notify(%s, %s);", (CHANNEL, PROBE_PAYLOAD))
+                if not first:
+                    self._dispatch(None, None)
+                first = False
+                self._listen(conn)
+            except psycopg2.Error as e:
+                logger.warning("change listener lost its connection: %s", e)
+                self._stop.wait(RECONNECT_DELAY)
+            finally:
+                conn.close()
+
+    def _listen(self, conn):
+        connected = last_resync = time.monotonic()
+        resync_interval = self.resync_interval
+        probed = False
+        self.delivering = None
+        while not self._stop.is_set():
+            select.select([conn], [], [], self.poll_interval)
+            conn.poll()
+            # Several statements in one burst only need one call per table,
+            # with the union of their ids (None wins)
+            changes = {}
+            for notice in conn.notifies:
+                if notice.payload == PROBE_PAYLOAD:
+                    probed = True
+                    continue
+                table, ids = parse_payload(notice.payload)
+                if ids is None or (table in changes and changes[table] is None):
+                    changes[table] = None
+                else:
+                    changes.setdefault(table, set()).update(ids)
+            conn.notifies.clear()
+            for table, ids in changes.items():
+                self._dispatch(table, sorted(ids) if ids is not None else None)
+            if probed and not self.delivering:
+                self.delivering = True
+                resync_interval = self.resync_interval
+            elif self.delivering is None and time.monotonic() - connected >= PROBE_TIMEOUT:
+                self.delivering = False
+                resync_interval = min(self.resync_interval, FALLBACK_RESYNC_INTERVAL)
+                params = conn.get_dsn_parameters()
+                logger.warning(
+                    "change listener on %s:%s received no notifications; LISTEN does not work through a "
+                    "transaction pooler, point LISTEN_HOST/LISTEN_PORT at a direct or session-mode "
+                    "connection. Resyncing every %s seconds meanwhile",
+                    params.get("host"), params.get("port"), resync_interval,
+                )
+            if time.monotonic() - last_resync >= resync_interval:
+                last_resync = time.monotonic()
+                self._dispatch(None, None)
+
+    def _dispatch(self, table, ids):
+        try:
+            self.on_change(table, ids)
+        except Exception:
+            logger.exception("change handler failed for %s", table)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def start_listener(connect_kwargs, on_change):
+    # Idempotent like db.init_pool(): one listener per process
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = ChangeListener(connect_kwargs, on_change).start()
+        return _listener
+
+
+def main(argv):
+    if len(argv) != 2 or argv[1] != "setup":
+        print(f"usage: python {argv[0]} setup")
+        return 2
+
+    db.init_pool(**db.settings_from_env())
+    with db.connection() as conn:
+        setup(conn)
+    print(f"setup: triggers on {', '.join(WATCHED_TABLES)} done")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,134 @@
+import pandas as pd
+
+import db
+
+# The dashboard's read queries. Each query_* function takes a connection so
+# the same SQL can run from the app (through the loader caches and the
+# snapshot cache), from the benchmark harness, or from maintenance scripts.
+# Frames come back compact (see db.compact_frame): int32 ids, float32 sums
+# where they fit, categorical names.
+
+county_and_state_sql = """
+SELECT
+    c.county_id,
+    c.county_name,
+    c.state_id,
+    s.state_name
+FROM
+    "public"."County" c
+JOIN
+    "public"."State" s ON c.state_id = s.state_id
+;
+"""
+
+states_sql = 'SELECT * FROM "State";'
+
+# Reads the pre-aggregated county rollup (see rollups.py) instead of
+# joining every tract on each cache miss. Names come from County and State
+# as they are now, not as of the last refresh: renaming one bumps the
+# rollup stamp (see rollups.py), so every name-keyed frame reloads together.
+low_access_sql = '''
+SELECT
+    c.county_name,
+    r.county_id,
+    r.population1,
+    r."lowIncomei1",
+    r.kids1,
+    r.seniors1,
+    r.white1,
+    r.black1,
+    r.asian1,
+    r.islander1,
+    r.americindian1,
+    r.other1,
+    r.hisp1,
+    r."noVehicle1",
+    r.snap1,
+    r.tract_count,
+    r.total_population
+FROM
+    "public"."county_rollup" r
+JOIN
+    "public"."County" c ON c.county_id = r.county_id
+ORDER BY
+    c.county_name;
+'''
+
+# Every state's population, low access population, urban/rural split and the
+# LowAccess1Mile sums the comparison view needs, from the state rollup, so
+# switching states is a lookup instead of a query
+state_figures_sql = """
+SELECT
+    s.state_name,
+    r.total_population,
+    r.low_access_population,
+    r.urban_population,
+    r.urban_low_access_population,
+    r.rural_population,
+    r.rural_low_access_population,
+    r.population1,
+    r."lowIncomei1",
+    r.kids1,
+    r.seniors1,
+    r."noVehicle1",
+    r.snap1
+FROM
+    public."state_rollup" r
+JOIN
+    public."State" s ON s.state_id = r.state_id
+WHERE
+    r.total_population IS NOT NULL;
+"""
+
+# Name -> SQL for every fixed query the dashboard runs
+APP_QUERIES = {
+    "states": states_sql,
+    "lowAccess": low_access_sql,
+    "state_rollup": state_figures_sql,
+    "county_and_state": county_and_state_sql,
+}
+
+
+def query_states(conn):
+    return db.read_frame(conn, states_sql, categories=["state_name"])
+
+
+def query_lowAccess(conn):
+    return db.read_frame(conn, low_access_sql, categories=["county_name"])
+
+
+def query_state_rollup(conn):
+    return db.read_frame(conn, state_figures_sql, categories=["state_name"]).set_index("state_name")
+
+
+def query_county_and_state(conn):
+    return db.read_frame(conn, county_and_state_sql, categories=["county_name", "state_name"])
+
+
+# -----------------------------
+# PER-STATE LOOKUPS
+# -----------------------------
+def state_row(state_rollup, state_name):
+    if state_name in state_rollup.index:
+        return state_rollup.loc[state_name]
+    # State without any tracts yet
+    return pd.Series(0, index=state_rollup.columns)
+
+
+def rural_vs_urban_records(state_row):
+    # Same shape as the old rural_vs_urban_sql result, one record per area type present
+    records = []
+    for area_type, prefix in (("Urban", "urban"), ("Rural", "rural")):
+        total = state_row[f"{prefix}_population"]
+        low_access = state_row[f"{prefix}_low_access_population"]
+        if pd.isna(total):
+            continue
+        total = float(total)
+        low_access = 0.0 if pd.isna(low_access) else float(low_access)
+        records.append({
+            "Area_Type": area_type,
+            "Total_Population": total,
+            "Low_Access_Population": low_access,
+            "Percentage_Low_Access": round(low_access / total * 100, 2) if total else None,
+        })
+    return records
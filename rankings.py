@@ -0,0 +1,78 @@
+import numpy as np
+
+# National rank and percentile of every county and state on each metric,
+# computed once per data version from the comparison metric frames (see
+# compare.py). Top-N / bottom-N charts become a slice of a presorted order
+# and "where does this place stand" is an index lookup, instead of a sorted
+# aggregate query per view.
+
+# Metric column -> label. Rank 1 is the highest value.
+RANK_METRICS = {
+    "low_access_share": "Low access share",
+    "noVehicle1": "No vehicle",
+    "snap1": "SNAP",
+    "lowIncomei1": "Low income",
+    "kids1": "Kids",
+    "seniors1": "Seniors",
+}
+
+
+class RankIndex:
+    """Ranks, percentiles and descending orders for every metric at once.
+
+    Places with no value for a metric are left unranked on that metric and
+    never show up in its top or bottom slices.
+    """
+
+    def __init__(self, metrics):
+        values = metrics[list(RANK_METRICS)].astype(np.float64)
+        self.values = values
+        # One vectorised pass per table: every metric column ranked together
+        ranks = values.rank(ascending=False, method="min")
+        # Share of ranked places with the same or a lower value, 0-100
+        percentiles = values.rank(ascending=True, method="max", pct=True) * 100
+        self.counts = values.count().to_numpy()
+
+        # Plain arrays plus a key -> row map, so a lookup is a dict hit and
+        # a row read rather than a pandas indexing call
+        self._values = values.to_numpy()
+        self._ranks = ranks.to_numpy()
+        self._percentiles = percentiles.to_numpy()
+        keys = values.index.to_numpy()
+        self._positions = {key: i for i, key in enumerate(keys.tolist())}
+
+        self._orders = {}
+        for j, metric in enumerate(RANK_METRICS):
+            column = self._values[:, j]
+            ranked = ~np.isnan(column)
+            # Stable, so ties keep the rollup's order
+            order = np.argsort(-column[ranked], kind="stable")
+            self._orders[metric] = keys[ranked][order]
+
+    def __len__(self):
+        return len(self._values)
+
+    def top(self, metric, n=10):
+        return self._orders[metric][:n]
+
+    def bottom(self, metric, n=10):
+        return self._orders[metric][::-1][:n]
+
+    def standing(self, key):
+        # One record per metric: value, rank (None if unranked), out of how
+        # many, percentile
+        i = self._positions.get(key)
+        if i is None:
+            return []
+        records = []
+        for j, (metric, label) in enumerate(RANK_METRICS.items()):
+            ranked = not np.isnan(self._ranks[i, j])
+            records.append({
+                "metric": metric,
+                "label": label,
+                "value": float(self._values[i, j]),
+                "rank": int(self._ranks[i, j]) if ranked else None,
+                "of": int(self.counts[j]),
+                "percentile": float(self._percentiles[i, j]) if ranked else None,
+            })
+        return records
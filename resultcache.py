@@ -0,0 +1,325 @@
+import collections
+import functools
+import logging
+import sys
+import threading
+
+import pandas as pd
+
+# Process-wide cache for the datasets the dashboard loads, bounded by the
+# memory the cached results actually take rather than by entry counts.
+#
+# Every loader caches into its own namespace, which can be cleared on its
+# own (see cache_dependencies() in streamlit_app.py) and can also cap its
+# number of entries. When the resident total goes over the byte budget,
+# entries are evicted across all namespaces: least recently used ("lru") or
+# least often used ("lfu", ties broken by age). Results are shared by every
+# session, like st.cache_resource; pandas copy-on-write keeps that safe.
+#
+# Loads are single-flight: when several sessions ask for the same missing
+# result at once (a popular state right after a link goes out, or every
+# session right after an invalidation), the first one runs the query and the
+# others wait for and share its result. A namespace with
+# stale_while_revalidate keeps invalidated entries as stale: callers get the
+# previous result straight away while one background load refreshes it.
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+POLICIES = ("lru", "lfu")
+STAT_FIELDS = ("hits", "stale_hits", "misses", "coalesced", "evictions", "rejected", "entries", "bytes")
+
+logger = logging.getLogger(__name__)
+
+
+def size_of(value):
+    # Bytes held by a cached result; DataFrames count their object columns'
+    # strings too
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(size_of(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class _Entry:
+    __slots__ = ("value", "nbytes", "hits", "stale")
+
+    def __init__(self, value, nbytes):
+        self.value = value
+        self.nbytes = nbytes
+        self.hits = 0
+        self.stale = False
+
+
+class _Flight:
+    # One load in progress; everyone asking for the same key waits on it
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class _Namespace:
+    def __init__(self, max_entries, stale_while_revalidate):
+        self.max_entries = max_entries
+        self.stale_while_revalidate = stale_while_revalidate
+        # Incremented by clear(), so a load that started before the clear
+        # cannot put its (possibly stale) result back afterwards
+        self.generation = 0
+        self.stats = collections.Counter()
+
+
+class ResultCache:
+    """Byte-bounded LRU/LFU cache with per-namespace invalidation and stats."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, policy="lru"):
+        self._lock = threading.Lock()
+        # (namespace, key) -> _Entry, least recently used first
+        self._entries = collections.OrderedDict()
+        # (namespace, key) -> _Flight
+        self._flights = {}
+        self._namespaces = {}
+        self.resident_bytes = 0
+        self.configure(max_bytes, policy)
+
+    def configure(self, max_bytes=None, policy=None):
+        if policy is not None and policy not in POLICIES:
+            raise ValueError(f"Unknown cache policy {policy}")
+        with self._lock:
+            if max_bytes is not None:
+                self.max_bytes = int(max_bytes)
+            if policy is not None:
+                self.policy = policy
+            self._evict()
+
+    def namespace(self, name, max_entries=None, stale_while_revalidate=False):
+        with self._lock:
+            ns = self._namespaces.get(name)
+            if ns is None:
+                ns = self._namespaces[name] = _Namespace(max_entries, stale_while_revalidate)
+            return ns
+
+    def get_or_load(self, name, key, load):
+        # The cached result, or load() run once however many callers ask
+        with self._lock:
+            ns = self._namespaces[name]
+            entry = self._entries.get((name, key))
+            flight = self._flights.get((name, key))
+            leader = flight is None
+            if entry is not None:
+                entry.hits += 1
+                self._entries.move_to_end((name, key))
+                if not entry.stale:
+                    ns.stats["hits"] += 1
+                    return entry.value
+                ns.stats["stale_hits"] += 1
+            elif leader:
+                ns.stats["misses"] += 1
+            else:
+                ns.stats["coalesced"] += 1
+            if leader:
+                flight = self._flights[(name, key)] = _Flight()
+                generation = ns.generation
+
+        if entry is not None:
+            # Stale: served as is, with at most one refresh running per key
+            if leader:
+                threading.Thread(target=self._fill, args=(name, key, load, flight, generation, True),
+                                 name=f"refresh-{name}", daemon=True).start()
+            return entry.value
+        if leader:
+            self._fill(name, key, load, flight, generation)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _fill(self, name, key, load, flight, generation, background=False):
+        try:
+            flight.value = load()
+            self.put(name, key, flight.value, generation)
+        except Exception as e:
+            flight.error = e
+            if background:
+                # Nobody is waiting on a background refresh; the stale
+                # entry stays and the next caller tries again
+                logger.warning("refreshing %s failed: %s", name, e)
+        finally:
+            with self._lock:
+                if self._flights.get((name, key)) is flight:
+                    del self._flights[(name, key)]
+            flight.done.set()
+
+    def get(self, name, key):
+        # (True, value) on a hit, (False, None) on a miss
+        with self._lock:
+            ns = self._namespaces[name]
+            entry = self._entries.get((name, key))
+            if entry is None:
+                ns.stats["misses"] += 1
+                return False, None
+            entry.hits += 1
+            self._entries.move_to_end((name, key))
+            ns.stats["hits"] += 1
+            return True, entry.value
+
+    def put(self, name, key, value, generation):
+        nbytes = size_of(value)
+        with self._lock:
+            ns = self._namespaces[name]
+            if generation != ns.generation:
+                return
+            if nbytes > self.max_bytes:
+                # Would evict everything else and still not fit
+                ns.stats["rejected"] += 1
+                return
+            previous = self._entries.pop((name, key), None)
+            if previous is not None:
+                self._remove(name, previous)
+            self._entries[(name, key)] = _Entry(value, nbytes)
+            self.resident_bytes += nbytes
+            ns.stats["entries"] += 1
+            ns.stats["bytes"] += nbytes
+            self._evict(name, keep=(name, key))
+
+    def clear(self, name=None):
+        # Drops the entries; loads already running are not joined any more
+        with self._lock:
+            names = list(self._namespaces) if name is None else [name]
+            for entry_name in names:
+                self._namespaces[entry_name].generation += 1
+            for entry_key in [k for k in self._entries if k[0] in names]:
+                self._remove(entry_key[0], self._entries.pop(entry_key))
+            for flight_key in [k for k in self._flights if k[0] in names]:
+                del self._flights[flight_key]
+
+    def invalidate(self, name=None):
+        # Like clear(), except that a stale_while_revalidate namespace keeps
+        # its entries, marked stale, until their refresh lands
+        with self._lock:
+            names = list(self._namespaces) if name is None else [name]
+            soft = [n for n in names if self._namespaces[n].stale_while_revalidate]
+            for entry_name in soft:
+                self._namespaces[entry_name].generation += 1
+            for entry_key in [k for k in self._entries if k[0] in soft]:
+                self._entries[entry_key].stale = True
+            for flight_key in [k for k in self._flights if k[0] in soft]:
+                del self._flights[flight_key]
+        hard = [n for n in names if n not in soft]
+        for entry_name in hard:
+            self.clear(entry_name)
+
+    def update(self, name, fn):
+        # Maintain a namespace in place: fn(key, value) returns the new value,
+        # the same value to keep it, or None to drop the entry. Loads that
+        # started before the update cannot put their older result back.
+        with self._lock:
+            items = [(k[1], e.value) for k, e in self._entries.items() if k[0] == name and not e.stale]
+        updated = [(key, old, fn(key, old)) for key, old in items]
+        sizes = {key: size_of(new) for key, old, new in updated if new is not None and new is not old}
+        with self._lock:
+            ns = self._namespaces[name]
+            for key, old, new in updated:
+                entry = self._entries.get((name, key))
+                if entry is None or entry.value is not old or new is old:
+                    continue
+                if new is None:
+                    self._remove(name, self._entries.pop((name, key)))
+                    continue
+                self.resident_bytes += sizes[key] - entry.nbytes
+                ns.stats["bytes"] += sizes[key] - entry.nbytes
+                entry.value = new
+                entry.nbytes = sizes[key]
+            ns.generation += 1
+            for flight_key in [k for k in self._flights if k[0] == name]:
+                del self._flights[flight_key]
+            self._evict()
+
+    def stats(self):
+        # One row per namespace, STAT_FIELDS
+        with self._lock:
+            return {
+                name: {field: ns.stats[field] for field in STAT_FIELDS}
+                for name, ns in self._namespaces.items()
+            }
+
+    def _remove(self, name, entry):
+        ns = self._namespaces[name]
+        self.resident_bytes -= entry.nbytes
+        ns.stats["entries"] -= 1
+        ns.stats["bytes"] -= entry.nbytes
+
+    def _victim(self, name, keep):
+        # Oldest first, so LFU ties go to the least recently used entry. The
+        # entry just put is never the victim (under LFU it has no hits yet).
+        keys = (k for k in self._entries if (name is None or k[0] == name) and k != keep)
+        if self.policy == "lru":
+            return next(keys)
+        return min(keys, key=lambda k: self._entries[k].hits)
+
+    def _evict(self, name=None, keep=None):
+        # Caller holds the lock. First the namespace's own entry cap, then
+        # the global byte budget.
+        if name is not None:
+            ns = self._namespaces[name]
+            while ns.max_entries is not None and ns.stats["entries"] > ns.max_entries:
+                self._evict_one(self._victim(name, keep))
+        while self.resident_bytes > self.max_bytes:
+            self._evict_one(self._victim(None, keep))
+
+    def _evict_one(self, entry_key):
+        self._remove(entry_key[0], self._entries.pop(entry_key))
+        self._namespaces[entry_key[0]].stats["evictions"] += 1
+
+
+cache = ResultCache()
+
+
+def configure(max_bytes=None, policy=None):
+    cache.configure(max_bytes, policy)
+
+
+def cached(name, max_entries=None, stale_while_revalidate=False):
+    """Cache a loader's results under namespace ``name``, keyed by its arguments.
+
+    Arguments must be hashable. The wrapper gets a ``clear()`` that drops the
+    namespace, like the st.cache_* decorators, and an ``invalidate()`` that
+    only marks it stale when ``stale_while_revalidate`` is set.
+    """
+    cache.namespace(name, max_entries, stale_while_revalidate)
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            return cache.get_or_load(name, key, lambda: fn(*args, **kwargs))
+        wrapper.clear = lambda: cache.clear(name)
+        wrapper.invalidate = lambda: cache.invalidate(name)
+        return wrapper
+    return decorate
+
+
+def stats():
+    return cache.stats()
+
+
+def to_prometheus():
+    lines = []
+    for metric, metric_type, field in [
+        ("dashboard_result_cache_hits_total", "counter", "hits"),
+        ("dashboard_result_cache_stale_hits_total", "counter", "stale_hits"),
+        ("dashboard_result_cache_misses_total", "counter", "misses"),
+        ("dashboard_result_cache_coalesced_total", "counter", "coalesced"),
+        ("dashboard_result_cache_evictions_total", "counter", "evictions"),
+        ("dashboard_result_cache_rejected_total", "counter", "rejected"),
+        ("dashboard_result_cache_entries", "gauge", "entries"),
+        ("dashboard_result_cache_bytes", "gauge", "bytes"),
+    ]:
+        lines.append(f"# TYPE {metric} {metric_type}")
+        for name, row in sorted(stats().items()):
+            lines.append(f'{metric}{{namespace="{name}"}} {row[field]:g}')
+    lines.append("# TYPE dashboard_result_cache_max_bytes gauge")
+    lines.append(f"dashboard_result_cache_max_bytes {cache.max_bytes:g}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,298 @@
+import sys
+
+import db
+
+# Summary tables the dashboard reads instead of re-aggregating tract level data.
+#
+#   python rollups.py setup     create the materialized views (idempotent)
+#   python rollups.py refresh   recompute them without blocking readers
+#
+# Both views carry a unique index so REFRESH ... CONCURRENTLY can swap in the
+# new rows while the app keeps reading the old ones. Every refresh bumps the
+# single row in rollup_version, which is what on-disk snapshots are checked
+# against (see snapshot.py). Its counter starts at 1 in every database, so
+# each bump also draws a random token: the stamp is "<version>-<token>", and
+# a checkout pointed at another database never takes its snapshots for ours.
+#
+# The app reads county and state names from County and State directly (the
+# lookup tables, and joined onto the rollups), keyed by the same stamp, so
+# setup also installs triggers that bump it on any change to those two.
+
+LOW_ACCESS_COLUMNS = [
+    "population1",
+    "lowIncomei1",
+    "kids1",
+    "seniors1",
+    "white1",
+    "black1",
+    "asian1",
+    "islander1",
+    "americindian1",
+    "other1",
+    "hisp1",
+    "noVehicle1",
+    "snap1",
+]
+
+ROLLUP_VIEWS = ["county_rollup", "state_rollup"]
+
+county_rollup_sql = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.county_rollup AS
+WITH la AS (
+    SELECT
+        ct.county_id,
+
+        -- All LowAccess1Mile columns aggregated
+        SUM(la.population1)     AS population1,
+        SUM(la."lowIncomei1")   AS "lowIncomei1",
+        SUM(la.kids1)           AS kids1,
+        SUM(la.seniors1)        AS seniors1,
+        SUM(la.white1)          AS white1,
+        SUM(la.black1)          AS black1,
+        SUM(la.asian1)          AS asian1,
+        SUM(la.islander1)       AS islander1,
+        SUM(la.americindian1)   AS americindian1,
+        SUM(la.other1)          AS other1,
+        SUM(la.hisp1)           AS hisp1,
+        SUM(la."noVehicle1")    AS "noVehicle1",
+        SUM(la.snap1)           AS snap1,
+
+        COUNT(*) AS tract_count
+    FROM
+        "public"."LowAccess1Mile" la
+    JOIN
+        "public"."CensusTract" ct ON la.tract_id = ct.tract_id
+    GROUP BY
+        ct.county_id
+),
+fai AS (
+    -- Everyone in the county, the denominator of its low access share
+    SELECT
+        ct.county_id,
+        SUM(fai."POP2010") AS total_population
+    FROM
+        "public"."FoodAccessIndicator" fai
+    JOIN
+        "public"."CensusTract" ct ON fai.tract_id = ct.tract_id
+    GROUP BY
+        ct.county_id
+)
+SELECT
+    c.county_id,
+    c.county_name,
+    c.state_id,
+    la.population1,
+    la."lowIncomei1",
+    la.kids1,
+    la.seniors1,
+    la.white1,
+    la.black1,
+    la.asian1,
+    la.islander1,
+    la.americindian1,
+    la.other1,
+    la.hisp1,
+    la."noVehicle1",
+    la.snap1,
+    la.tract_count,
+    fai.total_population
+FROM
+    "public"."County" c
+JOIN la ON la.county_id = c.county_id
+LEFT JOIN fai ON fai.county_id = c.county_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS county_rollup_county_id_idx
+    ON public.county_rollup (county_id);
+"""
+
+state_rollup_sql = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.state_rollup AS
+WITH la AS (
+    SELECT
+        c.state_id,
+        SUM(la.population1)     AS population1,
+        SUM(la."lowIncomei1")   AS "lowIncomei1",
+        SUM(la.kids1)           AS kids1,
+        SUM(la.seniors1)        AS seniors1,
+        SUM(la.white1)          AS white1,
+        SUM(la.black1)          AS black1,
+        SUM(la.asian1)          AS asian1,
+        SUM(la.islander1)       AS islander1,
+        SUM(la.americindian1)   AS americindian1,
+        SUM(la.other1)          AS other1,
+        SUM(la.hisp1)           AS hisp1,
+        SUM(la."noVehicle1")    AS "noVehicle1",
+        SUM(la.snap1)           AS snap1,
+        COUNT(*) AS tract_count
+    FROM
+        "public"."LowAccess1Mile" la
+    JOIN
+        "public"."CensusTract" ct ON la.tract_id = ct.tract_id
+    JOIN
+        "public"."County" c ON ct.county_id = c.county_id
+    GROUP BY
+        c.state_id
+),
+fai AS (
+    -- Tracts with no Urban flag count as rural
+    SELECT
+        c.state_id,
+        SUM(fai."POP2010") AS total_population,
+        SUM(fai."LowAccessPopulation1and10") AS low_access_population,
+        SUM(fai."POP2010") FILTER (WHERE fai."Urban" = 1) AS urban_population,
+        SUM(fai."LowAccessPopulation1and10") FILTER (WHERE fai."Urban" = 1) AS urban_low_access_population,
+        SUM(fai."POP2010") FILTER (WHERE fai."Urban" IS DISTINCT FROM 1) AS rural_population,
+        SUM(fai."LowAccessPopulation1and10") FILTER (WHERE fai."Urban" IS DISTINCT FROM 1) AS rural_low_access_population
+    FROM
+        "public"."FoodAccessIndicator" fai
+    JOIN
+        "public"."CensusTract" ct ON fai.tract_id = ct.tract_id
+    JOIN
+        "public"."County" c ON ct.county_id = c.county_id
+    GROUP BY
+        c.state_id
+)
+SELECT
+    s.state_id,
+    s.state_name,
+    la.population1,
+    la."lowIncomei1",
+    la.kids1,
+    la.seniors1,
+    la.white1,
+    la.black1,
+    la.asian1,
+    la.islander1,
+    la.americindian1,
+    la.other1,
+    la.hisp1,
+    la."noVehicle1",
+    la.snap1,
+    la.tract_count,
+    fai.total_population,
+    fai.low_access_population,
+    fai.urban_population,
+    fai.urban_low_access_population,
+    fai.rural_population,
+    fai.rural_low_access_population
+FROM
+    "public"."State" s
+LEFT JOIN la ON la.state_id = s.state_id
+LEFT JOIN fai ON fai.state_id = s.state_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS state_rollup_state_id_idx
+    ON public.state_rollup (state_id);
+"""
+
+rollup_version_sql = """
+CREATE TABLE IF NOT EXISTS public.rollup_version (
+    id boolean PRIMARY KEY DEFAULT true CHECK (id),
+    version bigint NOT NULL,
+    refreshed_at timestamptz NOT NULL DEFAULT now()
+);
+
+ALTER TABLE public.rollup_version
+    ADD COLUMN IF NOT EXISTS token text NOT NULL DEFAULT left(md5(random()::text), 16);
+
+INSERT INTO public.rollup_version (version) VALUES (1) ON CONFLICT DO NOTHING;
+"""
+
+bump_version_sql = """
+UPDATE public.rollup_version
+SET version = version + 1, token = left(md5(random()::text), 16), refreshed_at = now();
+"""
+
+# Tables whose edits change what the app shows without a refresh
+LABEL_TABLES = ["County", "State"]
+
+label_trigger_function_sql = f"""
+CREATE OR REPLACE FUNCTION public.rollup_bump_version() RETURNS trigger AS $$
+BEGIN
+    {bump_version_sql.strip()}
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+label_trigger_sql = """
+DROP TRIGGER IF EXISTS rollup_bump_version ON public."{table}";
+CREATE TRIGGER rollup_bump_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public."{table}"
+    FOR EACH STATEMENT EXECUTE FUNCTION public.rollup_bump_version();
+"""
+
+
+# Columns added to a view after it first shipped. CREATE ... IF NOT EXISTS
+# keeps an existing view as it is, so setup() rebuilds one that lacks them.
+ADDED_COLUMNS = {
+    "county_rollup": ["total_population"],
+}
+
+
+def _drop_outdated(cur):
+    for view, columns in ADDED_COLUMNS.items():
+        cur.execute(
+            "SELECT attname FROM pg_attribute "
+            "WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped;",
+            (f"public.{view}",),
+        )
+        existing = {row[0] for row in cur.fetchall()}
+        if existing and not set(columns) <= existing:
+            cur.execute(f"DROP MATERIALIZED VIEW public.{view};")
+
+
+def setup(conn):
+    cur = conn.cursor()
+    _drop_outdated(cur)
+    cur.execute(county_rollup_sql)
+    cur.execute(state_rollup_sql)
+    cur.execute(rollup_version_sql)
+    cur.execute(label_trigger_function_sql)
+    for table in LABEL_TABLES:
+        cur.execute(label_trigger_sql.format(table=table))
+    cur.close()
+    conn.commit()
+
+
+def refresh(conn):
+    # CONCURRENTLY keeps the views readable during the refresh; each view is
+    # committed on its own so readers see new county data as soon as it is ready
+    cur = conn.cursor()
+    for view in ROLLUP_VIEWS:
+        cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY public.{view};")
+        conn.commit()
+    bump_version(conn)
+    cur.close()
+
+
+def bump_version(conn):
+    cur = conn.cursor()
+    cur.execute(bump_version_sql)
+    cur.close()
+    conn.commit()
+
+
+def current_version(conn):
+    # The stamp every aggregate is cached and snapshotted under
+    cur = conn.cursor()
+    cur.execute("SELECT version, token FROM public.rollup_version;")
+    row = cur.fetchone()
+    cur.close()
+    return f"{row[0]}-{row[1]}" if row else "0"
+
+
+def main(argv):
+    commands = {"setup": setup, "refresh": refresh}
+    if len(argv) != 2 or argv[1] not in commands:
+        print(f"usage: python {argv[0]} [setup|refresh]")
+        return 2
+
+    db.init_pool(**db.settings_from_env())
+    with db.connection() as conn:
+        commands[argv[1]](conn)
+    print(f"{argv[1]}: {', '.join(ROLLUP_VIEWS)} done")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,62 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# Runs the dashboard's independent loaders side by side. Each loader borrows
+# its own pooled connection (see db.py), so the pool's maxconn should be at
+# least DEFAULT_WORKERS for the queries to really overlap.
+
+DEFAULT_WORKERS = 4
+DEFAULT_TIMEOUT = 30
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers=DEFAULT_WORKERS):
+    # One executor per process, shared by every session like the pool
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dashboard-query")
+        return _executor
+
+
+class QueryError(Exception):
+    def __init__(self, name, cause):
+        super().__init__(f"{name} failed: {cause}")
+        self.name = name
+        self.cause = cause
+
+
+class QueryBatch:
+    """Named loader calls started together and collected one by one.
+
+    ``result(name)`` waits only for that loader, so a section can draw as soon
+    as its own data is ready. A loader that fails or runs past ``timeout``
+    raises QueryError for that name only; the other results are unaffected.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, wrap=None, executor=None):
+        self.timeout = timeout
+        # wrap(fn) -> fn, e.g. to attach Streamlit's script context to the worker
+        self.wrap = wrap
+        self.executor = executor or get_executor()
+        self._futures = {}
+
+    def submit(self, name, fn, *args, **kwargs):
+        if self.wrap is not None:
+            fn = self.wrap(fn)
+        future = self.executor.submit(fn, *args, **kwargs)
+        self._futures[name] = (future, time.monotonic() + self.timeout)
+        return future
+
+    def result(self, name):
+        future, deadline = self._futures[name]
+        try:
+            return future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            raise QueryError(name, f"no result after {self.timeout}s") from None
+        except Exception as e:
+            raise QueryError(name, e) from e
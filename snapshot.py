@@ -0,0 +1,80 @@
+import glob
+import os
+import re
+import threading
+
+import pyarrow as pa
+
+# On-disk Arrow snapshots of the aggregate frames, so a fresh process (or a new
+# replica) can draw the dashboard without re-running the aggregation queries.
+#
+# Each frame is written to <SNAPSHOT_DIR>/<name>-v<version>-f<format>.arrow,
+# where version is the rollup_version stamp from the database (see rollups.py:
+# the refresh counter plus a random token, unique per database and refresh)
+# and format is bumped whenever the loaders change the frames' columns or
+# dtypes. A snapshot is only used when both match; older files are removed
+# once a newer snapshot has been written.
+
+SNAPSHOT_FORMAT = 5
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshots")
+
+_write_lock = threading.Lock()
+
+
+def snapshot_dir():
+    return os.environ.get("SNAPSHOT_DIR", DEFAULT_SNAPSHOT_DIR)
+
+
+def snapshot_path(name, version):
+    return os.path.join(snapshot_dir(), f"{name}-v{version}-f{SNAPSHOT_FORMAT}.arrow")
+
+
+def read_snapshot(name, version):
+    path = snapshot_path(name, version)
+    if not os.path.exists(path):
+        return None
+    # Memory-mapped, so the OS page cache is shared between processes on the host
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas()
+
+
+def write_snapshot(name, version, df):
+    os.makedirs(snapshot_dir(), exist_ok=True)
+    path = snapshot_path(name, version)
+    table = pa.Table.from_pandas(df, preserve_index=True)
+
+    with _write_lock:
+        # Write next to the target and rename, so readers never see half a file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        _remove_stale(name, path)
+
+
+def _remove_stale(name, current_path):
+    pattern = re.compile(rf"^{re.escape(name)}-v\d+(-[0-9a-f]+)?(-f\d+)?\.arrow$")
+    for path in glob.glob(os.path.join(snapshot_dir(), f"{name}-v*.arrow")):
+        if path != current_path and pattern.match(os.path.basename(path)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def load_or_fetch(name, version, fetch):
+    # fetch() is only called when there is no snapshot for this data version
+    df = read_snapshot(name, version)
+    if df is not None:
+        return df
+
+    df = fetch()
+    try:
+        write_snapshot(name, version, df)
+    except (OSError, pa.ArrowException):
+        # A read-only or full disk only costs us the next cold start
+        pass
+    return df
@@ -1,227 +1,516 @@
 import streamlit as st
-import psycopg2
-from dotenv import load_dotenv
-import os
 import pandas as pd
-import decimal
+import threading
+
+import db
+import instrumentation
+import compare
+import county_search
+import demographics
+import embedded
+import notify
+import queries
+import rankings
+import resultcache
+import rollups
+import scheduler
+import snapshot
+import tract_export
+import tracts
 
 from streamlit_elements import elements, dashboard, mui, nivo
+from streamlit.errors import StreamlitInvalidLayoutContextError
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 st.set_page_config(layout="wide")
 st.title("FoodReach Dashboard")
 
-USER = st.secrets["USER"]
-PASSWORD = st.secrets["PASSWORD"]
-HOST = st.secrets["HOST"]
-DB_NAME = st.secrets["DBNAME"]
-PORT = st.secrets["PORT"]
-
-def convert_decimal(obj):
-    if isinstance(obj, decimal.Decimal):
-        return float(obj)
-    if isinstance(obj, dict):
-        return {k: convert_decimal(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [convert_decimal(i) for i in obj]
-    return obj
+# "postgres" (default) or "embedded": read-only, from the DuckDB file
+# written by `python embedded.py export` (replicas, demos, no database server)
+BACKEND = st.secrets.get("BACKEND", "postgres")
+EMBEDDED_PATH = st.secrets.get("EMBEDDED_PATH", embedded.DEFAULT_PATH)
+READ_ONLY = BACKEND == "embedded"
+POOL_MIN = int(st.secrets.get("POOL_MIN", db.DEFAULT_MIN_CONN))
+POOL_MAX = int(st.secrets.get("POOL_MAX", db.DEFAULT_MAX_CONN))
+QUERY_TIMEOUT = float(st.secrets.get("QUERY_TIMEOUT", scheduler.DEFAULT_TIMEOUT))
+EXPORT_MAX_ROWS = int(st.secrets.get("EXPORT_MAX_ROWS", tract_export.IN_APP_MAX_ROWS))
+
+# Memory budget and eviction policy ("lru" or "lfu") for the cached datasets
+# (see resultcache.py), shared by every session in the process
+resultcache.configure(
+    max_bytes=float(st.secrets.get("CACHE_MAX_MB", resultcache.DEFAULT_MAX_BYTES / 2**20)) * 2**20,
+    policy=st.secrets.get("CACHE_POLICY", "lru"),
+)
+
+# Opt-in query/render timings, shown in the sidebar panel
+instrumentation.configure(st.secrets.get("INSTRUMENTATION", False))
+instrumentation.begin_run()
+
+# County pie slices: (label, county rollup column)
+COUNTY_PIE_SLICES = [
+    ("Kids", "kids1"),
+    ("Low Income", "lowIncomei1"),
+    ("Seniors", "seniors1"),
+    ("White", "white1"),
+    ("Black", "black1"),
+    ("Asian", "asian1"),
+    ("Hispanic", "hisp1"),
+    ("No Vehicle", "noVehicle1"),
+]
 
 # -----------------------------
 # DATABASE HELPERS
 # -----------------------------
-@st.cache_data(ttl=0)
-def load_demographics(_conn):
-    cur = _conn.cursor()
-    cur.execute('SELECT * FROM "Demographics" LIMIT 50;')
-    results = cur.fetchall()
-    cols = [desc[0] for desc in cur.description]
-    cur.close()
-    return pd.DataFrame(results, columns=cols)
-
-@st.cache_data(ttl=0)
-def load_lowAccess(_conn):
-    cur = _conn.cursor()
-    sql = '''
-    SELECT
-    c.county_name,
-    c.county_id,
-
-    -- All LowAccess1Mile columns aggregated
-    SUM(la.population1)     AS population1,
-    SUM(la."lowIncomei1")   AS "lowIncomei1",
-    SUM(la.kids1)           AS kids1,
-    SUM(la.seniors1)        AS seniors1,
-    SUM(la.white1)          AS white1,
-    SUM(la.black1)          AS black1,
-    SUM(la.asian1)          AS asian1,
-    SUM(la.islander1)       AS islander1,
-    SUM(la.americindian1)   AS americindian1,
-    SUM(la.other1)          AS other1,
-    SUM(la.hisp1)           AS hisp1,
-    SUM(la."noVehicle1")    AS "noVehicle1",
-    SUM(la.snap1)           AS snap1,
-
-    COUNT(*) AS tract_count
-
-FROM 
-    "public"."LowAccess1Mile" la
-JOIN 
-    "public"."CensusTract" ct ON la.tract_id = ct.tract_id
-JOIN 
-    "public"."County" c ON ct.county_id = c.county_id
-
-GROUP BY 
-    c.county_id,
-    c.county_name
-ORDER BY 
-    county_name;
-    '''
-    cur.execute(sql)
-    results = cur.fetchall()
-    cols = [desc[0] for desc in cur.description]
-    cur.close()
-    return pd.DataFrame(results, columns=cols)
-@st.cache_data(ttl=0)
-def load_no_vehicle_bar(_conn):
-    query = """
-        SELECT 
-            s.state_name,
-            c.county_name,
-            SUM(la."noVehicle1") AS "Households_NoCar_LowAccess"
-        FROM 
-            public."State" s
-        JOIN 
-            public."County" c ON s.state_id = c.state_id
-        JOIN 
-            public."CensusTract" ct ON c.county_id = ct.county_id
-        JOIN 
-            public."LowAccess1Mile" la ON ct.tract_id = la.tract_id
-        GROUP BY 
-            s.state_name, c.county_name
-        HAVING 
-            SUM(la."noVehicle1") IS NOT NULL
-        ORDER BY 
-            "Households_NoCar_LowAccess" DESC
-        LIMIT 10;
-    """
-
-    cur = _conn.cursor()
-    cur.execute(query)
-    results = cur.fetchall()
-    cols = [desc[0] for desc in cur.description]
-    cur.close()
-
-    return pd.DataFrame(results, columns=cols)
+# Datasets read from the database live in the byte-bounded result cache;
+# max_entries additionally caps the number of grid pages kept. Datasets
+# invalidated by change notifications revalidate in the background: after
+# someone else's edit, viewers get the previous page while one reload runs.
+@instrumentation.loader("demographics_page")
+@resultcache.cached("demographics_page", max_entries=64, stale_while_revalidate=True)
+@instrumentation.cache_miss
+def load_demographics_page(after, sort, descending, tract_prefix):
+    return db.run(demographics.fetch_page, after, sort, descending, tract_prefix)
+
+@instrumentation.loader("data_version")
+@st.cache_data
+@instrumentation.cache_miss
+def load_data_version():
+    # Stamp bumped by every rollup refresh; part of every aggregate's cache key.
+    # Cleared by the change listener when rollup_version is updated.
+    return db.run(rollups.current_version)
+
+def with_script_context(fn):
+    # Loader threads need the session's script context for the st.cache_* loaders
+    ctx = get_script_run_ctx()
+
+    def run(*args, **kwargs):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+    return run
+
+# The aggregate frames are shared: one copy per data version for the whole
+# process, handed to every session without the pickle-and-copy st.cache_data
+# does on each hit. Pandas copy-on-write keeps that safe: a session that
+# modifies one gets its own copy. Only the current and previous versions are
+# kept, and an evicted one comes back from its snapshot. When the stamp moves,
+# every session asks for the new version at once and the query runs once.
+@instrumentation.loader("states")
+@resultcache.cached("states", max_entries=2, stale_while_revalidate=True)
+@instrumentation.cache_miss
+def load_states(data_version):
+    return db.run(queries.query_states)
+
+@instrumentation.loader("lowAccess")
+@resultcache.cached("lowAccess", max_entries=2)
+@instrumentation.cache_miss
+def load_lowAccess(data_version):
+    return snapshot.load_or_fetch("county_rollup", data_version,
+                                  lambda: db.run(queries.query_lowAccess))
+
+@instrumentation.loader("state_rollup")
+@resultcache.cached("state_rollup", max_entries=2)
+@instrumentation.cache_miss
+def load_state_rollup(data_version):
+    return snapshot.load_or_fetch("state_rollup", data_version,
+                                  lambda: db.run(queries.query_state_rollup))
+
+@instrumentation.loader("county_and_state")
+@resultcache.cached("county_and_state", max_entries=2)
+@instrumentation.cache_miss
+def load_county_and_state(data_version):
+    return snapshot.load_or_fetch("county_and_state", data_version,
+                                  lambda: db.run(queries.query_county_and_state))
+
+@instrumentation.loader("county_index")
+@st.cache_resource(max_entries=2)
+@instrumentation.cache_miss
+def load_county_index(data_version):
+    # Shared by every session; labels are a dict lookup, search is a bisect
+    return county_search.CountyIndex(load_county_and_state(data_version))
+
+# Comparison metrics (see compare.py), computed once per data version and
+# shared read-only by every session like the county index
+@instrumentation.loader("county_metrics")
+@st.cache_resource(max_entries=2)
+@instrumentation.cache_miss
+def load_county_metrics(data_version):
+    return compare.county_metrics(load_lowAccess(data_version))
+
+@instrumentation.loader("state_metrics")
+@st.cache_resource(max_entries=2)
+@instrumentation.cache_miss
+def load_state_metrics(data_version):
+    return compare.state_metrics(load_state_rollup(data_version))
+
+# National ranks and percentiles (see rankings.py), same lifetime as the
+# metrics they are computed from
+@instrumentation.loader("county_ranks")
+@st.cache_resource(max_entries=2)
+@instrumentation.cache_miss
+def load_county_ranks(data_version):
+    return rankings.RankIndex(load_county_metrics(data_version))
+
+@instrumentation.loader("state_ranks")
+@st.cache_resource(max_entries=2)
+@instrumentation.cache_miss
+def load_state_ranks(data_version):
+    return rankings.RankIndex(load_state_metrics(data_version))
+
+# Tract drill-down (see tracts.py): the most recently opened counties, shared
+# by every session, and the radar's top tracts per county
+@instrumentation.loader("county_tracts")
+@resultcache.cached("county_tracts", max_entries=tracts.CACHED_COUNTIES, stale_while_revalidate=True)
+@instrumentation.cache_miss
+def load_county_tracts(county_id):
+    return db.run(tracts.fetch_county_tracts, county_id)
+
+@instrumentation.loader("top_tracts")
+@resultcache.cached("top_tracts", max_entries=64, stale_while_revalidate=True)
+@instrumentation.cache_miss
+def load_top_tracts(county_id, metric):
+    return db.run(tracts.fetch_top_tracts, county_id, metric)
+
+# Cached datasets fed by each watched table (see notify.py). The aggregates
+# read the rollups, which LowAccess1Mile and FoodAccessIndicator edits only
+# reach through `rollups.py refresh`; that bumps rollup_version, and every
+# aggregate is keyed by the version stamp. County and State edits bump the
+# stamp straight away (a trigger from `rollups.py setup`), as the state
+# list, the county labels and the rollups' names are read from them.
+def cache_dependencies():
+    return {
+        "Demographics": [load_demographics_page, load_top_tracts],
+        "CensusTract": [load_county_tracts, load_top_tracts],
+        "LowAccess1Mile": [load_county_tracts],
+        "FoodAccessIndicator": [load_county_tracts],
+        "rollup_version": [load_data_version],
+    }
+
+def apply_demographics_rows(rows):
+    # Demographics rows as they now are (grid columns): patch them into the
+    # cached grid pages and drop the radar entries of their counties, in
+    # O(changed rows), instead of reloading every cached page and radar.
+    # Page keys are load_demographics_page's positional arguments.
+    def patch_page(key, value):
+        page, next_after = value
+        patched = demographics.patch_page(page, rows, sort=key[0][1], tract_prefix=key[0][3])
+        if patched is None:
+            return None
+        if patched is page:
+            return value
+        return patched, next_after
+
+    resultcache.cache.update("demographics_page", patch_page)
+    counties = db.run(tracts.fetch_tract_counties, rows["tract_id"].tolist())
+    resultcache.cache.update("top_tracts", lambda key, top: None if key[0][0] in counties else top)
+
+def on_table_change(table, ids=None):
+    if table == "Demographics" and ids is not None:
+        # Just these rows were updated (see notify.ROW_TABLES)
+        apply_demographics_rows(db.run(demographics.fetch_rows, ids))
+        return
+    dependencies = cache_dependencies()
+    if table is None:
+        # Listener reconnected and may have missed notifications, or its
+        # periodic consistency check
+        targets = [loader for loaders in dependencies.values() for loader in loaders]
+    else:
+        targets = dependencies.get(table, [])
+    for loader in targets:
+        # Stale-while-revalidate where the loader supports it
+        getattr(loader, "invalidate", loader.clear)()
 
 
 # -----------------------------
 # CONNECT
 # -----------------------------
+# One pool per process, shared by every session and rerun
 try:
-    conn = psycopg2.connect(
-        dbname=DB_NAME,
-        user=USER,
-        password=PASSWORD,
-        host=HOST,
-        port=PORT
-    )
+    if BACKEND == "embedded":
+        # The file never changes under a running process, nothing to listen for
+        embedded.init_pool(EMBEDDED_PATH)
+    else:
+        db.init_pool(
+            minconn=POOL_MIN,
+            maxconn=POOL_MAX,
+            dbname=st.secrets["DBNAME"],
+            user=st.secrets["USER"],
+            password=st.secrets["PASSWORD"],
+            host=st.secrets["HOST"],
+            port=st.secrets["PORT"]
+        )
+        # LISTEN needs a session-level connection, not a transaction pooler
+        listen_kwargs = dict(
+            db.get_pool().connect_kwargs,
+            host=st.secrets.get("LISTEN_HOST", st.secrets["HOST"]),
+            port=st.secrets.get("LISTEN_PORT", st.secrets["PORT"]),
+        )
+        notify.start_listener(listen_kwargs, on_table_change)
     st.success("Connected successfully!")
 except Exception as e:
     st.error(f"Error: {e}")
     st.stop()
 
-demographics_table = load_demographics(conn)
-lowAccess_table = load_lowAccess(conn)
-bar_table = load_no_vehicle_bar(conn)
-state_table = pd.read_sql('SELECT * FROM "State";', conn)
-population_vs_access_sql = """
-SELECT 
-    s.state_name, 
-    SUM(fai."POP2010") AS Total_Population, 
-    SUM(fai."LowAccessPopulation1and10") AS Low_Access_Population
-FROM 
-    "public"."State" s
-JOIN 
-    "public"."County" c ON s.state_id = c.state_id
-JOIN 
-    "public"."CensusTract" ct ON c.county_id = ct.county_id
-JOIN 
-    "public"."FoodAccessIndicator" fai ON ct.tract_id = fai.tract_id
-WHERE 
-    s.state_name = '{selected_state}' 
-GROUP BY 
-    s.state_name;
-"""
-
-rural_vs_urban_sql = """
-SELECT 
-    CASE 
-        WHEN fai."Urban" = 1 THEN 'Urban' 
-        ELSE 'Rural' 
-    END AS "Area_Type",
-    SUM(fai."POP2010") AS "Total_Population",
-    SUM(fai."LowAccessPopulation1and10") AS "Low_Access_Population",
-    ROUND(
-        (SUM(fai."LowAccessPopulation1and10")::numeric / NULLIF(SUM(fai."POP2010"), 0)) * 100, 
-        2
-    ) AS "Percentage_Low_Access"
-FROM 
-    "public"."State" s
-JOIN 
-    "public"."County" c ON s.state_id = c.state_id
-JOIN 
-    "public"."CensusTract" ct ON c.county_id = ct.county_id
-JOIN 
-    "public"."FoodAccessIndicator" fai ON ct.tract_id = fai.tract_id
-WHERE 
-    s.state_name = '{selected_state}'
-GROUP BY 
-    fai."Urban";
-"""
-
-county_and_state_sql = """
-SELECT 
-    c.county_id,
-    c.county_name,
-    s.state_name
-FROM
-    "public"."County" c 
-JOIN 
-    "public"."State" s ON c.state_id = s.state_id
-;
-"""
-
-
-# Example usage (uncomment and adapt as needed):
-
-
-
-
-# STATE SELECTOR
-state_list = state_table["state_name"].dropna().unique()
-selected_state = st.selectbox("Select State", state_list, index=0)
-population_vs_access_data = pd.read_sql(population_vs_access_sql.format(selected_state=selected_state), conn)
-rural_vs_urban_data = pd.read_sql(rural_vs_urban_sql.format(selected_state=selected_state), conn)
-
-
-st.subheader("Dashboard By State")
-
-with elements("state_food_access"):
-    layout = [
-        dashboard.Item("pie_chart", 0, 0, 6, 3),
-        dashboard.Item("bar_chart", 6, 0, 6, 3),
-
-    ]
-
-    with dashboard.Grid(layout):
-
-        # Pie Chart (Nivo)
-        with mui.Paper(key="pie_chart", elevation=1, sx={"padding": 2}):
-            mui.Typography(f"Share of {selected_state} Population considered Low Access", variant="h6", sx={"mb": 2})
-            PIE_DATA = [
-                {"id": "non-access", "label": "Non-Access", "value": float(population_vs_access_data["total_population"][0] - population_vs_access_data["low_access_population"][0])},
-                {"id": "low-access", "label": "Low Access", "value": float(population_vs_access_data["low_access_population"][0])},
-            ]
 
+# -----------------------------
+# SECTIONS
+# -----------------------------
+def memoized_payload(name, key, build):
+    # Chart payloads are rebuilt only when what they are drawn from changes
+    # (key); otherwise the section's rerun hands the same list back to the
+    # chart. One entry per chart and session. That saves building it, not
+    # sending it: an elements frame serializes its whole tree on every run,
+    # which is why each chart with its own widgets is its own fragment.
+    memo = st.session_state.setdefault("payload_memo", {})
+    entry = memo.get(name)
+    if entry is None or entry[0] != key:
+        entry = memo[name] = (key, instrumentation.payload(name, build()))
+    return entry[1]
+
+
+def national_standing(rank_index, key, places):
+    # "Where does this place stand": one precomputed row per metric
+    st.caption(f"National rank among {places} (1 = highest)")
+    for col, row in zip(st.columns(len(rankings.RANK_METRICS)), rank_index.standing(key)):
+        if row["rank"] is None:
+            col.metric(row["label"], "n/a")
+        else:
+            col.metric(row["label"], f"#{row['rank']:,}", help=f"of {row['of']:,} {places}")
+            col.caption(f"Percentile: {row['percentile']:.0f}")
+
+
+def rerun_section():
+    # Rerun just the section the click came from; a click can also arrive in
+    # a full run (e.g. the first run after a reconnect), which must rerun it all
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitInvalidLayoutContextError:
+        st.rerun()
+
+
+# Each section is a fragment: a widget inside it reruns only that section,
+# so picking a county no longer redraws the state dashboard (or re-runs the
+# loaders) and vice versa. A fragment rerun reuses the batch of the last full
+# run; the next full rerun picks up invalidated data.
+@st.fragment
+@instrumentation.timed("state_dashboard")
+def state_dashboard(batch, data_version):
+    try:
+        state_table = batch.result("states")
+        state_rollup = batch.result("state_rollup")
+        state_ranks = batch.result("state_ranks")
+    except scheduler.QueryError as e:
+        st.subheader("Dashboard By State")
+        st.error(f"Error: {e}")
+        return
+
+    # STATE SELECTOR
+    state_list = state_table["state_name"].dropna().unique()
+    selected_state = st.selectbox("Select State", state_list, index=0)
+    state_row = queries.state_row(state_rollup, selected_state)
+
+
+    st.subheader("Dashboard By State")
+    national_standing(state_ranks, selected_state, "states")
+
+    with elements("state_food_access"):
+        layout = [
+            dashboard.Item("pie_chart", 0, 0, 6, 3),
+            dashboard.Item("bar_chart", 6, 0, 6, 3),
+
+        ]
+
+        with dashboard.Grid(layout):
+
+            # Pie Chart (Nivo)
+            with mui.Paper(key="pie_chart", elevation=1, sx={"padding": 2}):
+                mui.Typography(f"Share of {selected_state} Population considered Low Access", variant="h6", sx={"mb": 2})
+                PIE_DATA = memoized_payload("state_pie", (data_version, selected_state), lambda: [
+                    {"id": "non-access", "label": "Non-Access", "value": float(state_row["total_population"] - state_row["low_access_population"])},
+                    {"id": "low-access", "label": "Low Access", "value": float(state_row["low_access_population"])},
+                ])
+
+                with mui.Box(sx={"height": "100%", "width": "100%"}):
+                    nivo.Pie(
+                        data=PIE_DATA,
+                        innerRadius=0.5,
+                        padAngle=0.5,
+                        margin={"top": 30, "right": 40, "bottom": 40, "left": 40},
+                        activeOuterRadiusOffset=8,
+                        borderWidth=1,
+                        borderColor={"from": "color", "modifiers": [["darker", 0.2]]},
+                        arcLinkLabelsSkipAngle=5,
+                        arcLinkLabelsTextColor="#FFFFFF",
+                        arcLinkLabelsThickness=2,
+                        arcLinkLabelsDistance=30,
+                        arcLabelsSkipAngle=5,
+                        colors={"scheme": "nivo"},
+                        theme={
+                            "textColor": "#4F4F4F",
+                            "tooltip": {
+                                "container": {"background": "#ffffffdd", "color": "#222"}
+                            },
+                        },
+                        legends=[
+                            {
+                                "anchor": "top-left",
+                                "direction": "column",
+                                "translateX": -50,
+                                "translateY": 0,
+                                "itemWidth": 80,
+                                "itemHeight": 20,
+                                "itemTextColor": "#9E9E9E",
+                                "symbolSize": 12,
+                                "symbolShape": "circle",
+                                "effects": [
+                                    {
+                                        "on": "hover",
+                                        "style": {
+                                            "itemTextColor": "#7997B4"
+                                        }
+                                    }
+                                ]
+                            }
+                        ],
+                    )
+
+            # Bar Chart
+            with mui.Paper(key="bar_chart", elevation=1, sx={"padding": 2}):
+                mui.Typography(f"Rural vs Urban Low Access Population in {selected_state}", variant="h6", sx={"mb": 2})
+
+                with mui.Box(sx={"height": "80%", "width": "80%"}):
+                    BAR_DATA = memoized_payload("state_bar", (data_version, selected_state),
+                                                lambda: queries.rural_vs_urban_records(state_row))
+                    nivo.Bar(
+                        data=BAR_DATA,
+                        keys=["Low_Access_Population"],
+                        indexBy="Area_Type",
+                        margin={"top": 40, "right": 80, "bottom": 60, "left": 80},
+                        padding=0.3,
+                        valueScale={"type": "linear"},
+                        indexScale={"type": "band", "round": True},
+                        borderColor={"from": "color", "modifiers": [["darker", 1.6]]},
+                        axisTop=None,
+                        axisRight=None,
+                        axisBottom={
+                        "tickSize": 5,
+                        "tickPadding": 5,
+                        "tickRotation": 0,
+                        "legend": "Area Type",
+                        "legendPosition": "middle",
+                        "legendOffset": 40
+                        },
+                        axisLeft={
+                        "tickSize": 5,
+                        "tickPadding": 5,
+                        "tickRotation": 0,
+                        "legend": "Low Access Population",
+                        "legendPosition": "middle",
+                        "legendOffset": -50
+                        },
+                        labelSkipWidth=12,
+                        labelSkipHeight=12,
+                        labelTextColor={"from": "color", "modifiers": [["darker", 1.6]]},
+                        colors={"scheme": "nivo"},
+                        theme={
+                        "axis": {
+                            "ticks": {
+                            "text": {
+                                "fill": "#ffffff"
+                            }
+                            }
+                        }
+                        },
+                    )
+
+
+@st.fragment
+@instrumentation.timed("county_dashboard")
+def county_dashboard(batch, data_version):
+    try:
+        county_metrics = batch.result("county_metrics")
+        county_index = batch.result("county_index")
+        county_ranks = batch.result("county_ranks")
+    except scheduler.QueryError as e:
+        st.subheader("Dashboard By County")
+        st.error(f"Error: {e}")
+        return
+
+    # DASHBOARD 
+    st.subheader("Dashboard By County")
+
+    # COUNTY SELECTOR
+
+    # Type-ahead mode only sends the matching counties to the browser
+    if st.checkbox("Search counties by name"):
+        county_query = st.text_input("County name starts with", placeholder="e.g. Kings")
+        county_options = county_index.search(county_query)
+        if not county_options:
+            st.info("Type the start of a county name to pick a county.")
+            return
+    else:
+        county_options = county_index.ids
+
+    # Create selectbox that RETURNS county_id but DISPLAYS "County (State)"
+    selected_county_id = st.selectbox(
+        "Select County",
+        county_options,
+        format_func=county_index.label
+    )
+
+    # Get the selected row by county_id: an index lookup, not a scan. A
+    # county without any tract data has no rollup row, so this can be empty.
+    selected_row = county_metrics.loc[county_metrics.index.intersection([selected_county_id])]
+
+    national_standing(county_ranks, selected_county_id, "counties")
+
+    # Legacy compatibility
+    selected_county_name = selected_row["county_name"].iloc[0] if len(selected_row) else None
+    selected_county = selected_county_name
+
+
+    # DEBUGGING OUTPUTS
+    # st.write("Selected county (repr):", repr(selected_county))
+    # st.write("lowAccess_table columns:", lowAccess_table.columns.tolist())
+    # st.write("Unique county_name values (first 20):", lowAccess_table["county_name"].unique()[:20])
+
+    # selected_row = lowAccess_table[lowAccess_table["county_name"] == selected_county]
+    # st.write("selected_row shape:", selected_row.shape)
+    # st.write(selected_row.head())
+
+    # Every chart is its own elements frame, and each one with widgets of its
+    # own is a fragment too: paging the grid, or ranking by another metric,
+    # reruns and re-sends just that chart. Picking a county redraws them all.
+    pie_col, bar_col = st.columns([5, 7])
+    with pie_col:
+        county_pie(selected_row, selected_county_id, data_version)
+    with bar_col:
+        county_ranked_bar(county_ranks, county_index, data_version)
+    grid_col, radar_col = st.columns(2)
+    with grid_col:
+        county_grid()
+    with radar_col:
+        county_radar(selected_county_id)
+
+    tract_drilldown(selected_county_id, county_index.label(selected_county_id))
+
+
+def county_pie(selected_row, county_id, data_version):
+    if selected_row.empty:
+        st.info("No tract data for this county yet.")
+        return
+
+    def build():
+        # One tolist() gives plain floats; rounded, as the float32
+        # sums would otherwise carry spurious digits into the JSON
+        pie_values = selected_row[[col for _, col in COUNTY_PIE_SLICES]].iloc[0].tolist()
+        return [
+            {"id": label, "label": label, "value": round(value, 2)}
+            for (label, _), value in zip(COUNTY_PIE_SLICES, pie_values)
+        ]
+    PIE_DATA = memoized_payload("county_pie", (data_version, county_id), build)
+
+    with elements("county_pie"):
+        with mui.Paper(elevation=2, sx={"padding": 2, "height": 450}):
             with mui.Box(sx={"height": "100%", "width": "100%"}):
                 nivo.Pie(
                     data=PIE_DATA,
@@ -266,16 +555,38 @@ with elements("state_food_access"):
                     ],
                 )
 
-        # Bar Chart
-        with mui.Paper(key="bar_chart", elevation=1, sx={"padding": 2}):
-            mui.Typography(f"Rural vs Urban Low Access Population in {selected_state}", variant="h6", sx={"mb": 2})
 
-            with mui.Box(sx={"height": "80%", "width": "80%"}):
-                BAR_DATA = rural_vs_urban_data.to_dict(orient="records")
+@st.fragment
+@instrumentation.timed("county_ranked_bar")
+def county_ranked_bar(county_ranks, county_index, data_version):
+    # Top/bottom 10 for the bar chart: a slice of the precomputed order
+    rank_col, end_col = st.columns(2)
+    rank_metric = rank_col.selectbox(
+        "Rank counties by", list(rankings.RANK_METRICS),
+        index=list(rankings.RANK_METRICS).index("noVehicle1"),
+        format_func=rankings.RANK_METRICS.get,
+    )
+    rank_end = end_col.radio("Show", ["Top 10", "Bottom 10"], horizontal=True)
+    rank_label = rankings.RANK_METRICS[rank_metric]
+    # Shares are charted in percent
+    rank_scale = 100 if rank_metric in compare.SHARES else 1
+
+    def ranked_bar():
+        ranked = county_ranks.top(rank_metric) if rank_end == "Top 10" else county_ranks.bottom(rank_metric)
+        values = county_ranks.values.loc[ranked, rank_metric].to_numpy() * rank_scale
+        return [
+            {"county": county_index.label(county_id), rank_label: round(float(value), 2)}
+            for county_id, value in zip(ranked.tolist(), values)
+        ]
+    BAR_DATA = memoized_payload("ranked_bar", (data_version, rank_metric, rank_end), ranked_bar)
+
+    with elements("county_ranked_bar"):
+        with mui.Paper(elevation=2, sx={"padding": 2, "height": 450}):
+            with mui.Box(sx={"height": "100%", "width": "100%"}):
                 nivo.Bar(
                     data=BAR_DATA,
-                    keys=["Low_Access_Population"],
-                    indexBy="Area_Type",
+                    keys=[rank_label],
+                    indexBy="county",
                     margin={"top": 40, "right": 80, "bottom": 60, "left": 80},
                     padding=0.3,
                     valueScale={"type": "linear"},
@@ -284,115 +595,166 @@ with elements("state_food_access"):
                     axisTop=None,
                     axisRight=None,
                     axisBottom={
-                    "tickSize": 5,
-                    "tickPadding": 5,
-                    "tickRotation": 0,
-                    "legend": "Area Type",
-                    "legendPosition": "middle",
-                    "legendOffset": 40
+                        "tickSize": 5,
+                        "tickPadding": 5,
+                        "tickRotation": 30,
+                        "legend": "County",
+                        "legendPosition": "middle",
+                        "legendOffset": 50
                     },
                     axisLeft={
-                    "tickSize": 5,
-                    "tickPadding": 5,
-                    "tickRotation": 0,
-                    "legend": "Low Access Population",
-                    "legendPosition": "middle",
-                    "legendOffset": -50
+                        "tickSize": 5,
+                        "tickPadding": 5,
+                        "tickRotation": 0,
+                        "legend": f"{rank_label} (%)" if rank_scale == 100 else rank_label,
+                        "legendPosition": "middle",
+                        "legendOffset": -50
                     },
                     labelSkipWidth=12,
                     labelSkipHeight=12,
                     labelTextColor={"from": "color", "modifiers": [["darker", 1.6]]},
                     colors={"scheme": "nivo"},
-                    theme={
-                    "axis": {
-                        "ticks": {
-                        "text": {
-                            "fill": "#ffffff"
+                    legends=[
+                        {
+                            "dataFrom": "keys",
+                            "anchor": "top-right",
+                            "direction": "column",
+                            "justify": False,
+                            "translateX": 120,
+                            "translateY": 0,
+                            "itemsSpacing": 2,
+                            "itemWidth": 100,
+                            "itemHeight": 20,
+                            "itemDirection": "left-to-right",
+                            "itemOpacity": 0.85,
+                            "symbolSize": 20,
+                            "effects": [
+                                {
+                                    "on": "hover",
+                                    "style": {
+                                        "itemOpacity": 1
+                                    }
+                                }
+                            ]
                         }
+                    ],
+                    theme={
+                        "textColor": "#DFDFDF",
+                        "gridColor": "#dddddd",
+                        "tooltip": {
+                            "container": {
+                                "background": "#ffffff58",
+                                "color": "#333333",
+                            }
                         }
-                    }
                     },
                 )
 
-# DASHBOARD 
-st.subheader("Dashboard By County")
-
-# COUNTY SELECTOR
-
-county_and_state = pd.read_sql(county_and_state_sql, conn)
-
-# Create a mapping: county_id -> "county_name (state_name)"
-# Build your dataframe with ids + names
-county_display = county_and_state[["county_id", "county_name", "state_name"]]
-
-# Create selectbox that RETURNS county_id but DISPLAYS "County (State)"
-selected_county_id = st.selectbox(
-    "Select County",
-    county_display["county_id"],
-    format_func=lambda cid: 
-        county_display[county_display["county_id"] == cid][["county_name", "state_name"]]
-        .apply(lambda row: f"{row['county_name']} ({row['state_name']})", axis=1)
-        .iloc[0]
-)
-
-# Get the selected row from lowAccess_table using county_id (SAFE)
-selected_row = lowAccess_table[lowAccess_table["county_id"] == selected_county_id]
-
-# Legacy compatibility
-selected_county_name = selected_row["county_name"].iloc[0]
-selected_county = selected_county_name
-
-
-# DEBUGGING OUTPUTS
-# st.write("Selected county (repr):", repr(selected_county))
-# st.write("lowAccess_table columns:", lowAccess_table.columns.tolist())
-# st.write("Unique county_name values (first 20):", lowAccess_table["county_name"].unique()[:20])
-
-# selected_row = lowAccess_table[lowAccess_table["county_name"] == selected_county]
-# st.write("selected_row shape:", selected_row.shape)
-# st.write(selected_row.head())
-
-with elements("foodreach_dashboard"):
-
-    # Layout grid 
-    layout = [
-        dashboard.Item("radar_chart", 6, 3, 6, 3),
-        dashboard.Item("pie_chart", 0, 0, 5, 3),
-        dashboard.Item("bar_chart", 6, 0, 7, 3),
-        dashboard.Item("data_editor", 0, 3, 6, 3),
-    ]
-
-    with dashboard.Grid(layout):
 
+@st.fragment
+@instrumentation.timed("county_grid")
+def county_grid():
+    # DEMOGRAPHICS GRID: server-side sort, filter and keyset paging
+    sort_col, order_col, filter_col = st.columns(3)
+    grid_view = (
+        sort_col.selectbox("Sort demographics by", demographics.SORT_COLUMNS),
+        order_col.checkbox("Descending"),
+        filter_col.text_input("Tract ID starts with").strip(),
+    )
+    # A new sort or filter starts again from the first page
+    if st.session_state.get("demographics_view") != grid_view:
+        st.session_state["demographics_view"] = grid_view
+        st.session_state["demographics_cursors"] = [None]
+        st.session_state["demographics_edits"] = {}
+    cursors = st.session_state["demographics_cursors"]
+    # Unsaved cell edits on this page, {id: {column: value}}; like the grid,
+    # they are dropped when the page changes
+    grid_edits = st.session_state.setdefault("demographics_edits", {})
+
+    demographics_table, next_after = load_demographics_page(cursors[-1], *grid_view)
+
+    prev_col, page_col, next_col = st.columns([1, 2, 1])
+    if prev_col.button("Previous page", disabled=len(cursors) == 1):
+        cursors.pop()
+        grid_edits.clear()
+        rerun_section()
+    page_col.caption(f"Page {len(cursors)}")
+    if next_col.button("Next page", disabled=next_after is None):
+        cursors.append(next_after)
+        grid_edits.clear()
+        rerun_section()
+
+    def record_grid_edit(params):
+        # The grid's onCellEditCommit: params is {id, field, value}
+        grid_edits.setdefault(params["id"], {})[params["field"]] = params["value"]
+
+    with elements("county_grid"):
         # Data Editor (editable demographics table)
-        with mui.Paper(key="data_editor", elevation=2, sx={"padding": 2}):
+        with mui.Paper(elevation=2, sx={"padding": 2, "height": 450}):
             with mui.Box(sx={"height": "100%", "width": "100%"}):
                 columns = [
                     {"field": "tract_id", "headerName": "Tract ID", "width": 150},
-                    {"field": "TractLowIncome", "headerName": "Low Income", "width": 130, "editable": True},
-                    {"field": "TractKids", "headerName": "Kids", "width": 130, "editable": True},
-                    {"field": "TractSeniors", "headerName": "Seniors", "width": 130, "editable": True},
-                    {"field": "TractSNAP", "headerName": "SNAP", "width": 130, "editable": True}
+                    {"field": "TractLowIncome", "headerName": "Low Income", "width": 130, "editable": True, "type": "number"},
+                    {"field": "TractKids", "headerName": "Kids", "width": 130, "editable": True, "type": "number"},
+                    {"field": "TractSeniors", "headerName": "Seniors", "width": 130, "editable": True, "type": "number"},
+                    {"field": "TractSNAP", "headerName": "SNAP", "width": 130, "editable": True, "type": "number"}
                 ]
+                with instrumentation.span("demographics_grid_to_dict", "build"):
+                    grid_rows = demographics_table.to_dict(orient="records")
+                    # Each commit reruns the section; keep showing the
+                    # unsaved values rather than the cached ones
+                    for row in grid_rows:
+                        row.update(grid_edits.get(row["id"], {}))
                 mui.DataGrid(
-                    rows=demographics_table.to_dict(orient="records"),
+                    rows=instrumentation.payload("demographics_grid", grid_rows),
                     columns=columns,
-                    pageSize=10,
-                    rowsPerPageOptions=[10],
+                    pageSize=demographics.PAGE_SIZE,
+                    rowsPerPageOptions=[demographics.PAGE_SIZE],
                     checkboxSelection=False,
                     disableSelectionOnClick=True,
-                    experimentalFeatures={"newEditingApi": True},
+                    onCellEditCommit=record_grid_edit,
                     # You can add styling through sx={} if needed
                 )
 
-        # Radar Chart (Nivo)
-        with mui.Paper(key="radar_chart", elevation=2, sx={"padding": 2}):
-            DATA = demographics_table.head(8).to_dict(orient="records")
+    # SAVE BUTTON FOR DATA EDITOR
+    if st.button("Save Changes to Demographics", disabled=READ_ONLY,
+                 help="Read-only copy of the data" if READ_ONLY else None):
+
+        try:
+            edits = demographics.collect_edits(demographics_table, grid_edits)
+        except ValueError as e:
+            st.error(f"Error: {e}")
+            return
+
+        with db.connection() as conn:
+            demographics.save_edits(conn, edits)
+
+        st.success("Changes saved!")
+        grid_edits.clear()
+        # Only the Demographics pages and the radar read this table. The
+        # edited rows are patched into them right away, so the editor sees
+        # the change on this rerun; other processes get the row ids from the
+        # change notification and do the same. The radar is another section,
+        # so this reruns the whole page rather than just the grid.
+        apply_demographics_rows(demographics.saved_rows(demographics_table, edits))
+        st.rerun()
+
+
+@st.fragment
+@instrumentation.timed("county_radar")
+def county_radar(county_id):
+    # Radar: the county's top tracts, picked server-side
+    radar_metric = st.selectbox("Radar: top tracts by", demographics.EDITABLE_COLUMNS)
+    radar_table = load_top_tracts(county_id, radar_metric)
+    DATA = radar_table.astype({"tract_id": str}).to_dict(orient="records")
+
+    with elements("county_radar"):
+        with mui.Paper(elevation=2, sx={"padding": 2, "height": 450}):
             with mui.Box(sx={"height": "100%", "width": "100%"}):
                 nivo.Radar(
-                    data=DATA,
+                    data=instrumentation.payload("county_radar", DATA),
                     keys=["TractLowIncome", "TractKids", "TractSeniors", "TractSNAP"],
-                    indexBy="id",
+                    indexBy="tract_id",
                     margin={"top": 40, "right": 80, "bottom": 40, "left": 80},
                     dotBorderWidth=2,
                     gridLabelOffset=20,
@@ -433,163 +795,197 @@ with elements("foodreach_dashboard"):
                     }
                 )
 
-        # Pie Chart (Nivo)
-        with mui.Paper(key="pie_chart", elevation=2, sx={"padding": 2}):
-
-            PIE_DATA = [
-                {"id": "Kids", "label": "Kids", "value": float(selected_row["kids1"].iloc[0])},
-                {"id": "Low Income", "label": "Low Income", "value": float(selected_row["lowIncomei1"].iloc[0])},
-                {"id": "Seniors", "label": "Seniors", "value": float(selected_row["seniors1"].iloc[0])},
-                {"id": "White", "label": "White", "value": float(selected_row["white1"].iloc[0])},
-                {"id": "Black", "label": "Black", "value": float(selected_row["black1"].iloc[0])},
-                {"id": "Asian", "label": "Asian", "value": float(selected_row["asian1"].iloc[0])},
-                {"id": "Hispanic", "label": "Hispanic", "value": float(selected_row["hisp1"].iloc[0])},
-                {"id": "No Vehicle", "label": "No Vehicle", "value": float(selected_row["noVehicle1"].iloc[0])},
-            ]
-
-            with mui.Box(sx={"height": "100%", "width": "100%"}):
-                nivo.Pie(
-                    data=PIE_DATA,
-                    innerRadius=0.5,
-                    padAngle=0.5,
-                    margin={"top": 30, "right": 40, "bottom": 40, "left": 40},
-                    activeOuterRadiusOffset=8,
-                    borderWidth=1,
-                    borderColor={"from": "color", "modifiers": [["darker", 0.2]]},
-                    arcLinkLabelsSkipAngle=5,
-                    arcLinkLabelsTextColor="#FFFFFF",
-                    arcLinkLabelsThickness=2,
-                    arcLinkLabelsDistance=30,
-                    arcLabelsSkipAngle=5,
-                    colors={"scheme": "nivo"},
-                    theme={
-                        "textColor": "#4F4F4F",
-                        "tooltip": {
-                            "container": {"background": "#ffffffdd", "color": "#222"}
-                        },
-                    },
-                    legends=[
-                        {
-                            "anchor": "top-left",
-                            "direction": "column",
-                            "translateX": -50,
-                            "translateY": 0,
-                            "itemWidth": 80,
-                            "itemHeight": 20,
-                            "itemTextColor": "#9E9E9E",
-                            "symbolSize": 12,
-                            "symbolShape": "circle",
-                            "effects": [
-                                {
-                                    "on": "hover",
-                                    "style": {
-                                        "itemTextColor": "#7997B4"
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                )
 
-        # Bar Chart 
-        with mui.Paper(key="bar_chart", elevation=2, sx={"padding": 2}):
-           BAR_DATA = bar_table.to_dict(orient="records")
-           BAR_DATA = convert_decimal(BAR_DATA)
-           with mui.Box(sx={"height": "100%", "width": "100%"}):
-               nivo.Bar(
-                   data=BAR_DATA,
-                   keys=["Households_NoCar_LowAccess"],
-                    indexBy="county_name",
-                    margin={"top": 40, "right": 80, "bottom": 60, "left": 80},
-                    padding=0.3,
+def tract_drilldown(county_id, county_label):
+    # Loaded only once opened; only the visible page goes to the browser
+    if not st.toggle(f"Show census tracts in {county_label}", key="tract_drilldown"):
+        return
+    county_tracts = load_county_tracts(county_id)
+    pages = max(1, -(-len(county_tracts) // tracts.PAGE_SIZE))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1,
+                           key=f"tract_page_{county_id}")
+    start = (page - 1) * tracts.PAGE_SIZE
+    st.dataframe(county_tracts.iloc[start:start + tracts.PAGE_SIZE], hide_index=True)
+    st.caption(f"{len(county_tracts):,} tracts")
+
+
+@st.fragment
+@instrumentation.timed("compare_dashboard")
+def compare_dashboard(batch):
+    st.subheader("Compare")
+    mode = st.radio("Compare", ["Counties", "States"], horizontal=True, label_visibility="collapsed")
+    try:
+        if mode == "Counties":
+            metrics = batch.result("county_metrics")
+            county_index = batch.result("county_index")
+            picked = st.multiselect("Counties to compare", county_index.ids, format_func=county_index.label)
+            label = county_index.label
+        else:
+            metrics = batch.result("state_metrics")
+            picked = st.multiselect("States to compare", metrics.index.tolist())
+            label = str
+    except scheduler.QueryError as e:
+        st.error(f"Error: {e}")
+        return
+    if not picked:
+        st.info(f"Pick {mode.lower()} to compare them side by side.")
+        return
+
+    # Every ratio was computed for every place up front; this is one take
+    selection = compare.compare(metrics, picked)
+    # Counties without tract data have no metrics and drop out
+    labels = [label(key) for key in selection.index]
+    table = selection[list(compare.SHARES) + [f"{name}_vs_national" for name in compare.SHARES]]
+    table.index = labels
+    st.dataframe(table.rename(columns=compare.SHARE_LABELS), column_config={
+        f"{name}_vs_national": st.column_config.NumberColumn(f"{label} vs national", format="%.2fx")
+        for name, label in compare.SHARE_LABELS.items()
+    })
+
+    chart_data = compare.chart_records(selection, labels)
+    with elements("compare_dashboard"):
+        with mui.Paper(elevation=2, sx={"padding": 2, "height": 420}):
+            mui.Typography("Share of population (%)", variant="h6", sx={"mb": 2})
+            with mui.Box(sx={"height": 340, "width": "100%"}):
+                nivo.Bar(
+                    data=instrumentation.payload("compare_bar", chart_data),
+                    keys=list(compare.SHARE_LABELS.values()),
+                    indexBy="place",
+                    groupMode="grouped",
+                    margin={"top": 20, "right": 130, "bottom": 80, "left": 60},
+                    padding=0.2,
                     valueScale={"type": "linear"},
                     indexScale={"type": "band", "round": True},
-                    borderColor={"from": "color", "modifiers": [["darker", 1.6]]},
-                    axisTop=None,
-                    axisRight=None,
-                    axisBottom={
-                        "tickSize": 5,
-                        "tickPadding": 5,
-                        "tickRotation": 30,
-                        "legend": "County",
-                        "legendPosition": "middle",
-                        "legendOffset": 50
-                    },
-                    axisLeft={
-                        "tickSize": 5,
-                        "tickPadding": 5,
-                        "tickRotation": 0,
-                        "legend": "Households No Vehicle Low Access",
-                        "legendPosition": "middle",
-                        "legendOffset": -50
-                    },
-                    labelSkipWidth=12,
-                    labelSkipHeight=12,
-                    labelTextColor={"from": "color", "modifiers": [["darker", 1.6]]},
+                    axisBottom={"tickRotation": 30},
+                    enableLabel=False,
                     colors={"scheme": "nivo"},
                     legends=[
                         {
                             "dataFrom": "keys",
                             "anchor": "top-right",
                             "direction": "column",
-                            "justify": False,
                             "translateX": 120,
-                            "translateY": 0,
-                            "itemsSpacing": 2,
                             "itemWidth": 100,
                             "itemHeight": 20,
-                            "itemDirection": "left-to-right",
-                            "itemOpacity": 0.85,
-                            "symbolSize": 20,
-                            "effects": [
-                                {
-                                    "on": "hover",
-                                    "style": {
-                                        "itemOpacity": 1
-                                    }
-                                }
-                            ]
+                            "symbolSize": 14,
                         }
                     ],
-                    theme={
-                        "textColor": "#DFDFDF",
-                        "gridColor": "#dddddd",
-                        "tooltip": {
-                            "container": {
-                                "background": "#ffffff58",
-                                "color": "#333333",
-                            }
-                        }
-                    },
+                    theme={"textColor": "#DFDFDF"},
                 )
 
-# SAVE BUTTON FOR DATA EDITOR
-if st.button("Save Changes to Demographics"):
-
-    cursor = conn.cursor()
-
-    new_df = st.session_state["demographics"]["edited_rows"]
-
-    for row_index, row_changes in new_df.items():
-        row_id = demographics_table.loc[row_index, "id"]
 
-        set_clauses = []
-        values = []
+@st.fragment
+@instrumentation.timed("export_section")
+def export_section(batch):
+    st.subheader("Export tract data")
+    if READ_ONLY:
+        # Exports stream from a Postgres server-side cursor
+        st.info("Tract exports need the Postgres backend.")
+        return
+    try:
+        state_table = batch.result("states")
+        county_index = batch.result("county_index")
+    except scheduler.QueryError as e:
+        st.error(f"Error: {e}")
+        return
+
+    # Plain ints, which psycopg2 can adapt
+    state_names = dict(zip(state_table["state_id"].tolist(), state_table["state_name"].tolist()))
+    state_col, county_col, format_col = st.columns(3)
+    state_id = state_col.selectbox(
+        "State", [None] + list(state_names),
+        format_func=lambda sid: "All states" if sid is None else state_names[sid],
+        key="export_state",
+    )
+    county_ids = [] if state_id is None else county_index.in_state(state_id)
+    county_id = county_col.selectbox(
+        "County", [None] + county_ids,
+        format_func=lambda cid: "All counties" if cid is None else county_index.label(cid),
+        disabled=state_id is None, key="export_county",
+    )
+    fmt = format_col.radio("Format", list(tract_export.FORMATS), format_func=str.upper,
+                           index=1, horizontal=True, key="export_format")
+
+    scope = "national" if state_id is None else f"state-{state_id}" if county_id is None else f"county-{county_id}"
+    file_name = f"foodreach-tracts-{scope}.{fmt}"
+    # Streamlit keeps the whole file in memory, so large selections go
+    # through the command line instead
+    try:
+        rows = db.run(tract_export.count_rows, state_id, county_id)
+    except Exception as e:
+        st.error(f"Error: {e}")
+        return
+    if rows > EXPORT_MAX_ROWS:
+        st.info(
+            f"{rows:,} tracts is too many to download here (limit {EXPORT_MAX_ROWS:,}). "
+            "Narrow the selection, or export from the command line:"
+        )
+        st.code(tract_export.command_line(file_name, state_id, county_id), language="bash")
+        return
+
+    # Built only when clicked, off the script thread, streamed from a
+    # server-side cursor (see tract_export.py)
+    st.download_button(
+        f"Download {rows:,} tract rows",
+        data=lambda: tract_export.export_bytes(fmt, state_id, county_id, max_rows=EXPORT_MAX_ROWS),
+        file_name=file_name,
+        mime=tract_export.FORMATS[fmt],
+        on_click="ignore",
+    )
 
-        for col, new_val in row_changes.items():
-            set_clauses.append(f'"{col}" = %s')
-            values.append(new_val)
 
-        query = f"""
-            UPDATE "Demographics"
-            SET {", ".join(set_clauses)}
-            WHERE "id" = %s
-        """
+def instrumentation_panel():
+    with st.sidebar.expander("Instrumentation", expanded=False):
+        last_run = pd.DataFrame(instrumentation.current_session_records(last_run_only=True))
+        st.caption("This rerun")
+        st.dataframe(last_run, hide_index=True)
+
+        session = pd.DataFrame(instrumentation.current_session_records())
+        st.caption("This session")
+        if not session.empty:
+            st.dataframe(
+                session.groupby(["name", "kind"]).agg(
+                    calls=("wall_ms", "size"),
+                    wall_ms_p50=("wall_ms", "median"),
+                    wall_ms_max=("wall_ms", "max"),
+                    db_ms_total=("db_ms", "sum"),
+                    payload_bytes_max=("payload_bytes", "max"),
+                    cache_hits=("cache", lambda c: (c == "hit").sum()),
+                    cache_misses=("cache", lambda c: (c == "miss").sum()),
+                ),
+            )
+
+        # Process-wide, every session's loads included
+        cache = resultcache.cache
+        st.caption(f"Result cache: {cache.resident_bytes / 2**20:,.1f} of "
+                   f"{cache.max_bytes / 2**20:,.0f} MiB ({cache.policy.upper()})")
+        st.dataframe(pd.DataFrame.from_dict(resultcache.stats(), orient="index"))
+
+        st.download_button("Download JSON lines", instrumentation.to_jsonl(),
+                           file_name="dashboard-metrics.jsonl", mime="application/x-ndjson")
+        st.download_button("Download Prometheus text", instrumentation.to_prometheus() + resultcache.to_prometheus(),
+                           file_name="dashboard-metrics.prom", mime="text/plain")
 
-        values.append(int(row_id))
-        cursor.execute(query, values)
 
-    conn.commit()
-    st.success("Changes saved!")
-    st.cache_data.clear()
-    st.rerun()
+# -----------------------------
+# LOAD
+# -----------------------------
+# Independent loaders run side by side on their own pooled connections;
+# each section below waits only for the results it draws.
+data_version = load_data_version()
+batch = scheduler.QueryBatch(timeout=QUERY_TIMEOUT, wrap=with_script_context)
+batch.submit("states", load_states, data_version)
+batch.submit("state_rollup", load_state_rollup, data_version)
+batch.submit("county_metrics", load_county_metrics, data_version)
+batch.submit("state_metrics", load_state_metrics, data_version)
+batch.submit("county_ranks", load_county_ranks, data_version)
+batch.submit("state_ranks", load_state_ranks, data_version)
+batch.submit("county_index", load_county_index, data_version)
+
+state_dashboard(batch, data_version)
+county_dashboard(batch, data_version)
+compare_dashboard(batch)
+export_section(batch)
+
+if instrumentation.enabled:
+    instrumentation_panel()
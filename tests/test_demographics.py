@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+import demographics
+
+
+def page_of(*rows):
+    # Rows as (id, tract_id, TractLowIncome, TractKids, TractSeniors, TractSNAP)
+    return pd.DataFrame(list(rows), columns=demographics.DISPLAY_COLUMNS)
+
+
+PAGE = page_of(
+    (1, 1001000100, 10.0, 5.0, 2.0, 1.0),
+    (2, 1001000200, 20.0, 6.0, 3.0, None),
+    (3, 1003000100, 30.0, 7.0, 4.0, 2.0),
+)
+
+
+# -----------------------------
+# PATCH_PAGE
+# -----------------------------
+def test_unsorted_page_gets_new_values_in_place():
+    rows = page_of((2, 1001000200, 21.0, 6.0, 3.0, 9.0))
+    patched = demographics.patch_page(PAGE, rows, sort="id")
+    assert patched["TractSNAP"].tolist()[1] == 9.0
+    assert patched["TractLowIncome"].tolist() == [10.0, 21.0, 30.0]
+    # The cached page itself is left alone
+    assert pd.isna(PAGE["TractSNAP"].iloc[1])
+
+
+def test_page_without_the_rows_is_kept_as_is():
+    rows = page_of((9, 1005000100, 1.0, 1.0, 1.0, 1.0))
+    assert demographics.patch_page(PAGE, rows, sort="id") is PAGE
+
+
+def test_sorted_page_is_patched_when_the_sort_value_is_unchanged():
+    rows = page_of((2, 1001000200, 21.0, 6.0, 3.0, None))
+    patched = demographics.patch_page(PAGE, rows, sort="TractKids")
+    assert patched["TractLowIncome"].tolist() == [10.0, 21.0, 30.0]
+
+
+def test_sorted_page_is_dropped_when_the_sort_value_changes():
+    rows = page_of((2, 1001000200, 20.0, 60.0, 3.0, None))
+    assert demographics.patch_page(PAGE, rows, sort="TractKids") is None
+
+
+def test_sorted_page_is_dropped_when_a_row_from_elsewhere_changed():
+    # It may now sort onto this page
+    rows = page_of((9, 1005000100, 1.0, 6.5, 1.0, 1.0))
+    assert demographics.patch_page(PAGE, rows, sort="TractKids") is None
+
+
+def test_null_sort_value_written_again_is_unchanged():
+    rows = page_of((2, 1001000200, 25.0, 6.0, 3.0, None))
+    assert demographics.patch_page(PAGE, rows, sort="TractSNAP") is not None
+
+
+@pytest.mark.parametrize("sort, tract_prefix", [("tract_id", None), ("id", "1001")])
+def test_moved_row_drops_pages_ordered_or_filtered_by_tract(sort, tract_prefix):
+    rows = page_of((2, 1003000200, 20.0, 6.0, 3.0, None))
+    assert demographics.patch_page(PAGE, rows, sort=sort, tract_prefix=tract_prefix) is None
+
+
+def test_moved_row_is_patched_into_other_pages():
+    rows = page_of((2, 1003000200, 20.0, 6.0, 3.0, None))
+    patched = demographics.patch_page(PAGE, rows, sort="TractKids")
+    assert patched["tract_id"].tolist() == [1001000100, 1003000200, 1003000100]
+
+
+# -----------------------------
+# EDITS
+# -----------------------------
+def test_collect_edits_checks_columns_rows_and_numbers():
+    assert demographics.collect_edits(PAGE, {1: {"TractKids": "7", "TractSNAP": ""}}) == {
+        1: {"TractKids": 7.0, "TractSNAP": None},
+    }
+    for edits in ({1: {"tract_id": 5}}, {9: {"TractKids": 1}}, {1: {"TractKids": "many"}}):
+        with pytest.raises(ValueError):
+            demographics.collect_edits(PAGE, edits)
+
+
+def test_saved_rows_carry_the_edits():
+    rows = demographics.saved_rows(PAGE, {3: {"TractKids": 70.0}})
+    assert rows["id"].tolist() == [3]
+    assert rows["TractKids"].tolist() == [70.0]
+    assert demographics.patch_page(PAGE, rows, sort="id")["TractKids"].tolist() == [5.0, 6.0, 70.0]
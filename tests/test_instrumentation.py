@@ -0,0 +1,90 @@
+import types
+
+import pytest
+
+import instrumentation
+
+
+class FakeCtx:
+    def __init__(self, session_id, fragment_ids=None):
+        self.session_id = session_id
+        self.fragment_ids_this_run = fragment_ids
+
+
+@pytest.fixture
+def ctx(monkeypatch):
+    # The script-run context instrumentation sees; swap its fields per step
+    current = types.SimpleNamespace(value=FakeCtx("s1"))
+    monkeypatch.setattr(instrumentation, "get_script_run_ctx", lambda suppress_warning=False: current.value)
+    monkeypatch.setattr(instrumentation, "_records", instrumentation.collections.deque(maxlen=10))
+    monkeypatch.setattr(instrumentation, "_current_run", {})
+    instrumentation.configure(True)
+    yield current
+    instrumentation.configure(False)
+
+
+@instrumentation.timed("outer")
+def outer():
+    inner()
+
+
+@instrumentation.timed("inner")
+def inner():
+    pass
+
+
+def runs(name):
+    return [r["run"] for r in instrumentation.records() if r["name"] == name]
+
+
+# -----------------------------
+# RUN NUMBERS
+# -----------------------------
+def test_full_rerun_sections_share_the_run(ctx):
+    instrumentation.begin_run()
+    outer()
+    outer()
+    assert runs("outer") == [1, 1]
+
+
+def test_fragment_rerun_starts_a_run(ctx):
+    instrumentation.begin_run()
+    outer()
+    ctx.value = FakeCtx("s1", fragment_ids=["f"])
+    outer()
+    outer()
+    assert runs("outer") == [1, 2, 3]
+    # The nested fragment belongs to its parent's run
+    assert runs("inner") == [1, 2, 3]
+    inner()
+    assert runs("inner") == [1, 2, 3, 4]
+    assert instrumentation.current_session_records(last_run_only=True) == instrumentation.records(run=4)
+
+
+# -----------------------------
+# PRUNING
+# -----------------------------
+def test_sessions_without_records_are_forgotten(ctx, monkeypatch):
+    monkeypatch.setattr(instrumentation, "MAX_SESSIONS", 3)
+    for session_id in ["a", "b", "c"]:
+        ctx.value = FakeCtx(session_id)
+        instrumentation.begin_run()
+    # "c" has records, "a" and "b" do not
+    outer()
+    ctx.value = FakeCtx("d")
+    instrumentation.begin_run()
+    assert sorted(instrumentation._current_run) == ["c", "d"]
+
+
+def test_sessions_leave_with_their_records(ctx, monkeypatch):
+    monkeypatch.setattr(instrumentation, "MAX_SESSIONS", 1)
+    instrumentation.begin_run()
+    outer()
+    ctx.value = FakeCtx("s2")
+    instrumentation.begin_run()
+    assert sorted(instrumentation._current_run) == ["s1", "s2"]
+    # s2's records push s1's out of the buffer (maxlen 10)
+    for _ in range(5):
+        outer()
+    instrumentation.begin_run()
+    assert list(instrumentation._current_run) == ["s2"]
@@ -0,0 +1,278 @@
+import sys
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import resultcache
+
+# Every value below is a bytes object of this length, so the byte budget can
+# be given in entries
+VALUE_LEN = 100
+VALUE_BYTES = sys.getsizeof(bytes(VALUE_LEN))
+
+
+def value(tag):
+    return bytes([tag]) * VALUE_LEN
+
+
+def make_cache(entries, policy="lru", **namespace):
+    cache = resultcache.ResultCache(max_bytes=entries * VALUE_BYTES, policy=policy)
+    cache.namespace("a", **namespace)
+    return cache
+
+
+def load(cache, key, tag=None):
+    return cache.get_or_load("a", key, lambda: value(key if tag is None else tag))
+
+
+def keys(cache):
+    return sorted(key for _, key in cache._entries)
+
+
+# -----------------------------
+# SIZES AND EVICTION
+# -----------------------------
+def test_size_of_counts_frame_strings():
+    short = pd.DataFrame({"name": ["a"] * 10})
+    long = pd.DataFrame({"name": ["a" * 1000] * 10})
+    assert resultcache.size_of(long) > resultcache.size_of(short) + 9000
+
+
+def test_lru_evicts_least_recently_used_over_budget():
+    cache = make_cache(3)
+    for key in (1, 2, 3):
+        load(cache, key)
+    load(cache, 1)
+    load(cache, 4)
+    assert keys(cache) == [1, 3, 4]
+    assert cache.resident_bytes == 3 * VALUE_BYTES
+    stats = cache.stats()["a"]
+    assert (stats["evictions"], stats["entries"], stats["bytes"]) == (1, 3, 3 * VALUE_BYTES)
+
+
+def test_lfu_evicts_least_used_and_breaks_ties_by_age():
+    cache = make_cache(3, policy="lfu")
+    for key in (1, 2, 3):
+        load(cache, key)
+    for key in (1, 1, 3, 2):
+        load(cache, key)
+    # 2 and 3 have one hit each; 3 was used longer ago
+    load(cache, 4)
+    assert keys(cache) == [1, 2, 4]
+    # The new entry has no hits yet but is never its own victim
+    load(cache, 5)
+    assert keys(cache) == [1, 2, 5]
+
+
+def test_namespace_entry_cap_only_evicts_its_own_entries():
+    cache = make_cache(10)
+    cache.namespace("b", max_entries=2)
+    load(cache, 1)
+    for key in (1, 2, 3):
+        cache.get_or_load("b", key, lambda: value(key))
+    assert sorted(cache._entries) == [("a", 1), ("b", 2), ("b", 3)]
+
+
+def test_value_larger_than_budget_is_returned_but_not_kept():
+    cache = make_cache(1)
+    load(cache, 1)
+    big = bytes(10 * VALUE_LEN)
+    assert cache.get_or_load("a", 2, lambda: big) is big
+    assert keys(cache) == [1]
+    assert cache.stats()["a"]["rejected"] == 1
+
+
+def test_shrinking_the_budget_evicts():
+    cache = make_cache(3)
+    for key in (1, 2, 3):
+        load(cache, key)
+    cache.configure(max_bytes=VALUE_BYTES)
+    assert keys(cache) == [3]
+
+
+def test_clear_drops_one_namespace():
+    cache = make_cache(10)
+    cache.namespace("b")
+    load(cache, 1)
+    cache.get_or_load("b", 1, lambda: value(1))
+    cache.clear("a")
+    assert sorted(cache._entries) == [("b", 1)]
+    assert cache.resident_bytes == VALUE_BYTES
+    assert cache.stats()["a"]["bytes"] == 0
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        resultcache.ResultCache(policy="fifo")
+
+
+# -----------------------------
+# SINGLE-FLIGHT LOADS
+# -----------------------------
+class BlockingLoad:
+    # A load() that waits for release() and counts its calls
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self._release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self._release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def release(self):
+        self._release.set()
+
+
+def in_threads(n, fn):
+    # Start fn n times; returns (threads, results), results filled as
+    # ("ok", value) or ("error", exception)
+    results = []
+
+    def run():
+        try:
+            results.append(("ok", fn()))
+        except Exception as e:
+            results.append(("error", e))
+
+    threads = [threading.Thread(target=run) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def join(threads):
+    for thread in threads:
+        thread.join(5)
+        assert not thread.is_alive()
+
+
+def test_concurrent_misses_share_one_load():
+    cache = make_cache(10)
+    slow = BlockingLoad(value(1))
+    leader, results = in_threads(1, lambda: cache.get_or_load("a", 1, slow))
+    assert slow.started.wait(5)
+    followers, shared = in_threads(7, lambda: cache.get_or_load("a", 1, slow))
+    wait_for(lambda: cache.stats()["a"]["coalesced"] == 7)
+    slow.release()
+    join(leader + followers)
+
+    assert slow.calls == 1
+    assert results + shared == [("ok", value(1))] * 8
+    assert cache.stats()["a"]["misses"] == 1
+    assert load(cache, 1, tag=2) == value(1)
+
+
+def test_load_error_reaches_every_waiter_and_is_not_cached():
+    cache = make_cache(10)
+    failing = BlockingLoad(error=RuntimeError("database went away"))
+    leader, results = in_threads(1, lambda: cache.get_or_load("a", 1, failing))
+    assert failing.started.wait(5)
+    followers, shared = in_threads(3, lambda: cache.get_or_load("a", 1, failing))
+    wait_for(lambda: cache.stats()["a"]["coalesced"] == 3)
+    failing.release()
+    join(leader + followers)
+
+    assert failing.calls == 1
+    assert results + shared == [("error", failing.error)] * 4
+    assert keys(cache) == []
+    # The next caller tries again
+    assert load(cache, 1) == value(1)
+
+
+def test_clear_during_a_load_keeps_its_result_out():
+    cache = make_cache(10)
+    slow = BlockingLoad(value(1))
+    leader, results = in_threads(1, lambda: cache.get_or_load("a", 1, slow))
+    assert slow.started.wait(5)
+    cache.clear("a")
+    # Callers after the clear do not join the load that started before it
+    assert load(cache, 1, tag=2) == value(2)
+    slow.release()
+    join(leader)
+
+    assert results == [("ok", value(1))]
+    assert load(cache, 1, tag=3) == value(2)
+
+
+def test_invalidate_serves_stale_while_one_refresh_runs():
+    cache = make_cache(10, stale_while_revalidate=True)
+    load(cache, 1)
+    cache.invalidate("a")
+    refresh = BlockingLoad(value(2))
+    assert cache.get_or_load("a", 1, refresh) == value(1)
+    assert refresh.started.wait(5)
+    # Still stale, and no second refresh while the first runs
+    assert cache.get_or_load("a", 1, refresh) == value(1)
+    refresh.release()
+    wait_for(lambda: cache.get("a", 1) == (True, value(2)))
+
+    assert refresh.calls == 1
+    assert cache.stats()["a"]["stale_hits"] == 2
+
+
+def test_refresh_from_before_an_invalidate_is_dropped():
+    cache = make_cache(10, stale_while_revalidate=True)
+    load(cache, 1)
+    cache.invalidate("a")
+    refresh = BlockingLoad(value(2))
+    cache.get_or_load("a", 1, refresh)
+    assert refresh.started.wait(5)
+    cache.invalidate("a")
+    refresh.release()
+    join([t for t in threading.enumerate() if t.name == "refresh-a"])
+
+    # The late refresh did not land; the next caller starts a new one
+    assert cache.get_or_load("a", 1, lambda: value(3)) == value(1)
+    wait_for(lambda: cache.get("a", 1) == (True, value(3)))
+
+
+def test_invalidate_without_stale_while_revalidate_clears():
+    cache = make_cache(10)
+    load(cache, 1)
+    cache.invalidate("a")
+    assert keys(cache) == []
+
+
+# -----------------------------
+# IN-PLACE UPDATES
+# -----------------------------
+def test_update_replaces_keeps_and_drops_entries():
+    cache = make_cache(10)
+    for key in (1, 2, 3):
+        load(cache, key)
+    big = bytes(2 * VALUE_LEN)
+    cache.update("a", lambda key, old: {1: big, 2: old, 3: None}[key])
+
+    assert keys(cache) == [1, 2]
+    assert cache.get("a", 1) == (True, big)
+    assert cache.resident_bytes == sys.getsizeof(big) + VALUE_BYTES
+    assert cache.stats()["a"]["bytes"] == cache.resident_bytes
+
+
+def test_update_during_a_load_keeps_its_older_result_out():
+    cache = make_cache(10)
+    slow = BlockingLoad(value(1))
+    leader, results = in_threads(1, lambda: cache.get_or_load("a", 1, slow))
+    assert slow.started.wait(5)
+    cache.update("a", lambda key, old: old)
+    slow.release()
+    join(leader)
+
+    assert results == [("ok", value(1))]
+    assert keys(cache) == []
@@ -0,0 +1,188 @@
+import argparse
+import itertools
+import sys
+import tempfile
+
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+import db
+
+# Tract-level rows behind the county and state charts, for download.
+#
+#   python tract_export.py OUT.parquet [--state-id N] [--county-id N]
+#
+# Rows come off a server-side cursor BATCH_ROWS at a time and each batch is
+# written to the output before the next is fetched, so memory stays at one
+# batch whether the export is one county or the whole country.
+#
+# The in-app download is different: Streamlit holds the finished file in
+# memory (twice, with its media store copy), so export_bytes() refuses
+# selections of more than IN_APP_MAX_ROWS tracts. Use the command line for
+# those.
+
+BATCH_ROWS = 10000
+# Every single state fits; the whole country does not
+IN_APP_MAX_ROWS = 25000
+
+FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+tract_export_sql = """
+SELECT
+    s.state_name,
+    c.county_id,
+    c.county_name,
+    ct.tract_id,
+    fai."POP2010",
+    fai."Urban",
+    fai."LowAccessPopulation1and10",
+    la.population1,
+    la."lowIncomei1",
+    la.kids1,
+    la.seniors1,
+    la.white1,
+    la.black1,
+    la.asian1,
+    la.islander1,
+    la.americindian1,
+    la.other1,
+    la.hisp1,
+    la."noVehicle1",
+    la.snap1
+FROM
+    "public"."CensusTract" ct
+JOIN
+    "public"."County" c ON ct.county_id = c.county_id
+JOIN
+    "public"."State" s ON c.state_id = s.state_id
+LEFT JOIN
+    "public"."FoodAccessIndicator" fai ON fai.tract_id = ct.tract_id
+LEFT JOIN
+    "public"."LowAccess1Mile" la ON la.tract_id = ct.tract_id
+{where}
+ORDER BY
+    ct.tract_id;
+"""
+
+# Same tracts as tract_export_sql; the LEFT JOINs add no rows
+tract_count_sql = """
+SELECT count(*)
+FROM
+    "public"."CensusTract" ct
+JOIN
+    "public"."County" c ON ct.county_id = c.county_id
+JOIN
+    "public"."State" s ON c.state_id = s.state_id
+{where};
+"""
+
+
+def _where(state_id=None, county_id=None):
+    where = []
+    params = []
+    if state_id is not None:
+        where.append("c.state_id = %s")
+        params.append(state_id)
+    if county_id is not None:
+        where.append("c.county_id = %s")
+        params.append(county_id)
+    return ("WHERE " + " AND ".join(where) if where else ""), params
+
+
+def export_query(state_id=None, county_id=None):
+    where, params = _where(state_id, county_id)
+    return tract_export_sql.format(where=where), params
+
+
+def count_rows(conn, state_id=None, county_id=None):
+    where, params = _where(state_id, county_id)
+    cur = conn.cursor()
+    try:
+        return db.fetch_all(cur, tract_count_sql.format(where=where), params)[0][0]
+    finally:
+        cur.close()
+
+
+def command_line(out, state_id=None, county_id=None):
+    # The CLI equivalent of an in-app selection, for selections too large to download
+    args = ["python", "tract_export.py", out]
+    if state_id is not None:
+        args += ["--state-id", str(state_id)]
+    if county_id is not None:
+        args += ["--county-id", str(county_id)]
+    return " ".join(args)
+
+
+def tract_batches(conn, state_id=None, county_id=None, batch_rows=BATCH_ROWS):
+    query, params = export_query(state_id, county_id)
+    return db.stream_batches(conn, query, params, batch_rows=batch_rows, name="tract_export")
+
+
+def write_batches(batches, sink, fmt):
+    # sink is a path or a binary file object; returns the number of rows
+    batches = iter(batches)
+    first = next(batches)
+    if fmt == "csv":
+        writer = pa_csv.CSVWriter(sink, first.schema)
+    elif fmt == "parquet":
+        # One row group per batch
+        writer = pq.ParquetWriter(sink, first.schema)
+    else:
+        raise ValueError(f"Unknown export format {fmt}")
+
+    rows = 0
+    with writer:
+        for batch in itertools.chain([first], batches):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+def export(conn, sink, fmt, state_id=None, county_id=None):
+    return write_batches(tract_batches(conn, state_id, county_id), sink, fmt)
+
+
+def _export_capped(conn, sink, fmt, state_id, county_id, max_rows):
+    rows = count_rows(conn, state_id, county_id)
+    if rows > max_rows:
+        raise ValueError(
+            f"{rows:,} tracts is over the in-app limit of {max_rows:,}, "
+            f"run `{command_line('OUT.' + fmt, state_id, county_id)}` instead"
+        )
+    return export(conn, sink, fmt, state_id, county_id)
+
+
+def export_bytes(fmt, state_id=None, county_id=None, max_rows=IN_APP_MAX_ROWS):
+    # For st.download_button(data=callable): built on click, off the script
+    # thread, through a temporary file rather than an in-memory DataFrame.
+    # Streamlit serves downloads from memory, so the finished file is
+    # returned whole, and only up to max_rows tracts.
+    with tempfile.TemporaryFile() as sink:
+        db.run(_export_capped, sink, fmt, state_id, county_id, max_rows)
+        sink.seek(0)
+        return sink.read()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python tract_export.py")
+    parser.add_argument("out", help="output file; .csv or .parquet")
+    parser.add_argument("--state-id", type=int)
+    parser.add_argument("--county-id", type=int)
+    args = parser.parse_args(argv)
+
+    fmt = args.out.rsplit(".", 1)[-1].lower()
+    if fmt not in FORMATS:
+        parser.error("output file must end in .csv or .parquet")
+
+    db.init_pool(**db.settings_from_env())
+    with db.connection() as conn:
+        rows = export(conn, args.out, fmt, args.state_id, args.county_id)
+    print(f"export: {rows:,} tracts written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
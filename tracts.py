@@ -0,0 +1,78 @@
+import db
+import demographics
+
+# Census tracts of one county, loaded when the user opens the drill-down.
+#
+# Both queries start from CensusTract (county_id) and reach the other
+# tables by tract_id, all through indexes (see indexes.py), so their cost
+# follows the county's tract count rather than the size of the tables.
+
+# Rows of the tract table sent to the browser at a time
+PAGE_SIZE = 25
+# Recently opened counties kept in memory, shared by every session
+CACHED_COUNTIES = 32
+# Tracts on the radar chart
+RADAR_TOP_K = 8
+
+county_tracts_sql = """
+SELECT
+    ct.tract_id,
+    fai."POP2010",
+    fai."Urban",
+    fai."LowAccessPopulation1and10",
+    la."lowIncomei1",
+    la.kids1,
+    la.seniors1,
+    la."noVehicle1",
+    la.snap1
+FROM
+    "public"."CensusTract" ct
+LEFT JOIN
+    "public"."FoodAccessIndicator" fai ON fai.tract_id = ct.tract_id
+LEFT JOIN
+    "public"."LowAccess1Mile" la ON la.tract_id = ct.tract_id
+WHERE
+    ct.county_id = %s
+ORDER BY
+    ct.tract_id;
+"""
+
+# {metric} is checked against demographics.EDITABLE_COLUMNS first
+top_tracts_sql = """
+SELECT
+    d.tract_id,
+    d."TractLowIncome",
+    d."TractKids",
+    d."TractSeniors",
+    d."TractSNAP"
+FROM
+    "public"."Demographics" d
+JOIN
+    "public"."CensusTract" ct ON ct.tract_id = d.tract_id
+WHERE
+    ct.county_id = %s
+ORDER BY
+    d."{metric}" DESC NULLS LAST, d.id
+LIMIT %s;
+"""
+
+
+def fetch_county_tracts(conn, county_id):
+    return db.read_frame(conn, county_tracts_sql, (county_id,))
+
+
+def fetch_top_tracts(conn, county_id, metric, k=RADAR_TOP_K):
+    # Only the K rows the radar draws ever leave the database
+    if metric not in demographics.EDITABLE_COLUMNS:
+        raise ValueError(f"Cannot rank tracts by {metric}")
+    return db.read_frame(conn, top_tracts_sql.format(metric=metric), (county_id, k))
+
+
+def fetch_tract_counties(conn, tract_ids):
+    # County of each of these tracts, through the CensusTract primary key
+    cur = conn.cursor()
+    cur.execute('SELECT DISTINCT county_id FROM "public"."CensusTract" WHERE tract_id = ANY(%s);',
+                (list(tract_ids),))
+    counties = {row[0] for row in cur.fetchall()}
+    cur.close()
+    return counties